@@ -0,0 +1,149 @@
+import asyncio
+import json
+
+STATUS_TEXT = {
+    200: "OK",
+    204: "No Content",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class Request:
+    """A parsed HTTP/1.1 request."""
+
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        """Decode the body as JSON, treating an empty body as {}."""
+        return json.loads(self.body) if self.body else {}
+
+    @property
+    def keep_alive(self):
+        return self.headers.get("connection", "").lower() != "close"
+
+
+async def read_request(reader):
+    """Read one request from the stream, or return None if the client hung up."""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_BYTES:
+        raise ValueError("Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return Request(method, path.split("?", 1)[0], headers, body)
+
+
+async def send_response(writer, status, body=b"", content_type="application/json", headers=None):
+    """Write a complete response with a Content-Length."""
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}"]
+    if body or status != 204:
+        lines.append(f"Content-Type: {content_type}")
+    lines.append(f"Content-Length: {len(body)}")
+    for name, value in (headers or {}).items():
+        lines.append(f"{name}: {value}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+async def send_json(writer, status, payload, headers=None):
+    """Write a JSON response."""
+    await send_response(writer, status, json.dumps(payload).encode(), headers=headers)
+
+
+async def start_stream(writer, status=200, content_type="text/event-stream", headers=None):
+    """Write response headers for a chunked (streamed) body."""
+    lines = [
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+        f"Content-Type: {content_type}",
+        "Transfer-Encoding: chunked",
+        "Cache-Control: no-cache",
+    ]
+    for name, value in (headers or {}).items():
+        lines.append(f"{name}: {value}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+
+
+async def send_chunk(writer, data):
+    """Write one chunk of a streamed body."""
+    if isinstance(data, str):
+        data = data.encode()
+    if data:
+        writer.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        await writer.drain()
+
+
+async def send_event(writer, payload):
+    """Write one server-sent event carrying a JSON payload."""
+    await send_chunk(writer, f"data: {json.dumps(payload)}\n\n")
+
+
+async def end_stream(writer):
+    """Terminate a chunked body."""
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+async def serve(handler, host, port):
+    """Start an asyncio server that calls handler(request, writer) per request."""
+
+    async def handle_connection(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except (ValueError, asyncio.IncompleteReadError):
+                    await send_json(writer, 400, {"error": "Malformed request"})
+                    break
+                if request is None:
+                    break
+                await handler(request, writer)
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle_connection, host, port)
+
+
+async def request_json(host, port, method, path, payload=None):
+    """Send one JSON request and return (status, decoded body); used by load tests."""
+    reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    data = await reader.readexactly(length) if length else b""
+    writer.close()
+    return status, json.loads(data) if data else None
@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import statistics
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import llm_client
+from conversation import Conversation
+from main_chatbot import init_database, load_manual_database, start_warm_up
+from offspring_chatbot import answer_with_context, find_relevant_info, open_manual
+
+
+def read_questions(path):
+    """Read JSONL questions as dicts with request_id, equipment and question.
+
+    Lines are shaped like requests.jsonl: the question is taken from
+    'question', else 'body', else 'title'. Lines without a request_id
+    are numbered by position.
+    """
+    questions = []
+    with open(path) as file:
+        for line_no, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            questions.append({
+                "request_id": str(item.get("request_id") or f"line-{line_no}"),
+                "equipment": item.get("equipment", ""),
+                "question": item.get("question") or item.get("body") or item.get("title") or "",
+            })
+    return questions
+
+
+def answered_ids(path):
+    """Return the request_ids already answered successfully in an output file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run; that question is asked again
+                continue
+            if result.get("status") == "ok":
+                done.add(result["request_id"])
+    return done
+
+
+def resolve_equipment(name, catalog):
+    """Match an equipment name to (equipment_id, equipment_name), ignoring case."""
+    for equipment_name, equipment_id in catalog.items():
+        if equipment_name.lower() == name.strip().lower():
+            return equipment_id, equipment_name
+    return None
+
+
+def answer_one(item, relevant_info, retrieval_ms, equipment_id, equipment_name):
+    """Generate one answer and return its output record."""
+    start = time.perf_counter()
+    record = {"request_id": item["request_id"], "equipment": equipment_name, "question": item["question"]}
+    try:
+        record["answer"] = answer_with_context(
+            item["question"], relevant_info, equipment_name, Conversation(equipment_name), equipment_id
+        )
+        record["status"] = "ok"
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+    record["retrieval_ms"] = round(retrieval_ms, 1)
+    record["latency_ms"] = round(retrieval_ms + (time.perf_counter() - start) * 1000, 1)
+    return record
+
+
+def run_batch(input_path, output_path, concurrency=llm_client.MAX_CONCURRENT_GENERATIONS):
+    """Answer every question in input_path not yet answered in output_path.
+
+    Questions are grouped by equipment so each manual is loaded once.
+    Retrieval runs on this thread, handing each question to a pool
+    that runs up to `concurrency` generations at a time. Records are
+    appended to the output as they finish, so an interrupted run
+    resumes where it stopped; a question whose retrieval or generation
+    fails gets an error record and is asked again on the next run.
+    Returns the list of records written.
+    """
+    done = answered_ids(output_path)
+    pending = [item for item in read_questions(input_path) if item["request_id"] not in done]
+    print(f"{len(pending)} question(s) to answer, {len(done)} already done")
+
+    groups = defaultdict(list)
+    for item in pending:
+        groups[item["equipment"]].append(item)
+
+    catalog = load_manual_database()
+    records = []
+    with open(output_path, "a") as output, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        def write(record):
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            records.append(record)
+
+        futures = []
+        for equipment, items in groups.items():
+            resolved = resolve_equipment(equipment, catalog)
+            # One load per manual
+            opened = open_manual(resolved[0]) if resolved else None
+            if opened is None:
+                for item in items:
+                    write({"request_id": item["request_id"], "equipment": equipment, "question": item["question"],
+                           "status": "error", "error": f"no manual for equipment '{equipment}'"})
+                continue
+
+            equipment_id, equipment_name = resolved
+            _, manual_content = opened
+            for item in items:
+                start = time.perf_counter()
+                try:
+                    relevant_info = find_relevant_info(item["question"], manual_content, equipment_id)
+                except Exception as e:
+                    # Retrieval may embed the question through Ollama; this item is retried on resume
+                    write({"request_id": item["request_id"], "equipment": equipment_name, "question": item["question"],
+                           "status": "error", "error": f"retrieval failed: {e}"})
+                    continue
+                retrieval_ms = (time.perf_counter() - start) * 1000
+                futures.append(pool.submit(
+                    answer_one, item, relevant_info, retrieval_ms, equipment_id, equipment_name
+                ))
+
+        try:
+            for future in as_completed(futures):
+                write(future.result())
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            print("\nInterrupted; run again with the same output file to resume.")
+            raise
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions without the interactive menu.")
+    parser.add_argument("input", help="JSONL questions: request_id, equipment, and question (or title/body)")
+    parser.add_argument("output", help="JSONL answers; appended to, and resumed from if it exists")
+    parser.add_argument("--concurrency", type=int, default=llm_client.MAX_CONCURRENT_GENERATIONS,
+                        help="Questions in flight at once; AILEAN_MAX_GENERATIONS still caps generations (default: that cap)")
+    args = parser.parse_args()
+
+    start_warm_up()
+    init_database()
+    start = time.perf_counter()
+    try:
+        records = run_batch(args.input, args.output, args.concurrency)
+    except KeyboardInterrupt:
+        return
+    answered = [r["latency_ms"] for r in records if r["status"] == "ok"]
+    failed = len(records) - len(answered)
+    print(f"{len(answered)} answered, {failed} failed in {time.perf_counter() - start:.1f}s")
+    if answered:
+        print(f"  p50: {statistics.median(answered):.0f}ms  max: {max(answered):.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
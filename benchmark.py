@@ -0,0 +1,341 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+FILLER_WORDS = [
+    "the", "check", "remove", "install", "ensure", "assembly", "bolt", "carrier",
+    "inspect", "torque", "panel", "cover", "spring", "pin", "valve", "seal",
+]
+MANUAL_TERMS = ["engine", "fuel", "gear", "power", "barrel", "trigger", "cleaning", "system"]
+
+# Questions with a growing number of matched keywords
+QUESTIONS = [
+    "engine",
+    "engine fuel",
+    "engine fuel gear power",
+    "engine fuel gear power barrel trigger cleaning system",
+]
+
+# (question, passage, marker): passages planted in every synthetic manual to measure retrieval accuracy
+NEEDLES = [
+    ("my fuel pump has low pressure",
+     "Fuel pump pressure check. If fuel pressure at the pump drops below 30 psi, "
+     "replace the fuel pump diaphragm and recheck the fuel pressure. Reference FUELNEEDLE."),
+    ("the trigger is stuck and won't reset",
+     "Trigger stuck or fails to reset. Clean the trigger group, then check the trigger "
+     "disconnector spring for wear. Reference TRIGGERNEEDLE."),
+    ("failure to feed",
+     "Issue: Failure to Feed\nRemove the magazine, check the magazine lips and follower, "
+     "and reseat the magazine firmly. Reference FEEDNEEDLE."),
+    ("how do I clean the barrel",
+     "Cleaning: run a bore brush through the barrel from the chamber end, then dry "
+     "patches until they come out clean. Reference CLEANNEEDLE."),
+]
+NEEDLE_MARKERS = {question: passage.split()[-1].rstrip(".") for question, passage in NEEDLES}
+
+# Keyword counts for the keyword lookup sweep; lookups should not grow with manual size
+KEYWORD_COUNTS = [1, 4, 16, 64]
+DEFAULT_SIZES_KB = [100, 1000, 10000, 51200]
+FAKE_OLLAMA_PORT = 11501
+# Differences smaller than this are timer noise, never a regression
+MIN_REGRESSION_MS = 1.0
+
+
+def make_manual(size_bytes, seed=0):
+    """Build a synthetic manual of roughly size_bytes with paragraph breaks."""
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < size_bytes:
+        word = rng.choice(MANUAL_TERMS) if rng.random() < 0.01 else rng.choice(FILLER_WORDS)
+        if rng.random() < 0.02:
+            word += "\n\n"
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def plant_needles(text):
+    """Insert each NEEDLES passage as its own paragraph, spread through the back half of the manual."""
+    for i, (_, passage) in enumerate(NEEDLES):
+        position = int(len(text) * (0.5 + 0.4 * i / len(NEEDLES)))
+        paragraph = text.find("\n\n", position)
+        position = paragraph + 2 if paragraph != -1 else len(text)
+        text = f"{text[:position]}{passage}\n\n{text[position:]}"
+    return text
+
+
+def make_bench_manual(size_kb):
+    """Build the synthetic manual, with needles, used for one benchmark size."""
+    return plant_needles(make_manual(size_kb * 1024, seed=size_kb))
+
+
+def time_call(func, *args, repeat=3):
+    """Return the best wall-clock time of func(*args) over repeat runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def accuracy(retrieve):
+    """Fraction of NEEDLES questions whose planted passage appears in retrieve(question)."""
+    hits = sum(NEEDLE_MARKERS[question] in (retrieve(question) or "") for question, _ in NEEDLES)
+    return hits / len(NEEDLES)
+
+
+def bench_keyword_scan(sizes_kb, results):
+    """Time building a KeywordIndex once, then find_keyword_positions for a sweep of keyword counts.
+
+    "first" lookups search the index's vocabulary; "repeat" lookups are
+    what later questions pay once their keywords have been seen.
+    """
+    from offspring_chatbot import EQUIPMENT_TERMS, KeywordIndex, find_keyword_positions
+
+    keywords = list(dict.fromkeys(keyword for terms in EQUIPMENT_TERMS.values() for keyword in terms))
+    counts = [count for count in KEYWORD_COUNTS if count <= len(keywords)]
+
+    def first_lookup(index, count):
+        index.found.clear()
+        find_keyword_positions(keywords[:count], index)
+
+    print(f"{'size':>8} {'build':>9} " + " ".join(f"{count:>7} kw" for count in counts) + f"  {'repeat':>9}")
+    for size_kb in sizes_kb:
+        manual_lower = make_bench_manual(size_kb).lower()
+        start = time.perf_counter()
+        index = KeywordIndex(manual_lower)
+        build = (time.perf_counter() - start) * 1000
+        timings = [time_call(first_lookup, index, count) * 1000 for count in counts]
+        repeat = time_call(find_keyword_positions, keywords[:counts[-1]], index) * 1000
+        results[f"keywords/{size_kb}KB/build_ms"] = build
+        for count, timing in zip(counts, timings):
+            results[f"keywords/{size_kb}KB/{count}kw_ms"] = timing
+        results[f"keywords/{size_kb}KB/repeat_{counts[-1]}kw_ms"] = repeat
+        print(f"{size_kb:>6}KB {build:>7.1f}ms " + " ".join(f"{t:>8.2f}ms" for t in timings) + f"  {repeat:>7.3f}ms")
+
+
+def bench_extract(sizes_kb, results):
+    """Time the full-text extract_issue_info for each manual size and keyword count."""
+    from offspring_chatbot import extract_issue_info, lowered_manual
+
+    print(f"{'size':>8} " + " ".join(f"{len(q.split()):>7} kw" for q in QUESTIONS) + "  accuracy")
+    for size_kb in sizes_kb:
+        manual = make_bench_manual(size_kb)
+        lowered_manual(manual)  # lower-cased once per load, as in a chat session
+        timings = [time_call(extract_issue_info, question, manual) * 1000 for question in QUESTIONS]
+        for question, timing in zip(QUESTIONS, timings):
+            results[f"extract/{size_kb}KB/{len(question.split())}kw_ms"] = timing
+        score = accuracy(lambda question: extract_issue_info(question, manual))
+        results[f"extract/{size_kb}KB/accuracy"] = score
+        print(f"{size_kb:>6}KB " + " ".join(f"{t:>8.1f}ms" for t in timings) + f"  {score:>8.0%}")
+
+
+def bench_maintenance(sizes_kb, results):
+    """Time the M4 bot's section-map load and its extract_issue_info for each manual size."""
+    from maintenance_chatbot import ISSUE_KEYWORDS, build_section_map, extract_issue_info
+    from text_cache import MappedManual
+
+    print(f"{'size':>8} {'load':>10} {'extract':>10}  accuracy")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_kb in sizes_kb:
+            manual = make_bench_manual(size_kb)
+            text_path = os.path.join(tmp, f"{size_kb}.txt")
+            with open(text_path, "w", encoding="utf-8") as file:
+                file.write(manual)
+            start = time.perf_counter()
+            mapped = MappedManual(text_path, build_section_map(manual))
+            load_ms = (time.perf_counter() - start) * 1000
+            extract_ms = statistics.median(
+                time_call(extract_issue_info, question, mapped) * 1000 for question, _ in NEEDLES
+            )
+            # Only the questions this bot has sections for can find their needle
+            questions = [question for question, _ in NEEDLES if any(keyword in question for keyword in ISSUE_KEYWORDS)]
+            score = sum(NEEDLE_MARKERS[q] in extract_issue_info(q, mapped) for q in questions) / len(questions)
+            mapped.close()
+            results[f"maintenance/{size_kb}KB/load_ms"] = load_ms
+            results[f"maintenance/{size_kb}KB/extract_ms"] = extract_ms
+            results[f"maintenance/{size_kb}KB/accuracy"] = score
+            print(f"{size_kb:>6}KB {load_ms:>8.1f}ms {extract_ms:>8.1f}ms  {score:>8.0%}")
+
+
+def start_fake_model(latency):
+    """Run a fake Ollama server on a background event loop."""
+    from fake_ollama import start_fake_ollama
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(start_fake_ollama(port=FAKE_OLLAMA_PORT, latency=latency))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+
+def end_to_end(equipment_id, equipment_name, question):
+    """Answer one question through the streaming path; return (time to first token, total) in ms."""
+    from conversation import Conversation
+    from offspring_chatbot import stream_response
+
+    start = time.perf_counter()
+    first_token = None
+    for _ in stream_response(question, None, equipment_name, Conversation(equipment_name), equipment_id):
+        if first_token is None:
+            first_token = time.perf_counter() - start
+    return first_token * 1000, (time.perf_counter() - start) * 1000
+
+
+def used_bytes(conn):
+    """Bytes of the database in use, not counting free pages left by rebuilt indexes."""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    return (page_count - conn.execute("PRAGMA freelist_count").fetchone()[0]) * page_size
+
+
+def bench_index(sizes_kb, results, latency=None):
+    """Time ingestion, DB loads and chunk-index retrieval, plus end-to-end answers if latency is set."""
+    from create_db import create_database
+    from manual_index import index_manual
+    from manual_store import read_manual, store_manual
+    from offspring_chatbot import retrieve_issue_info
+    from semantic_index import index_vectors
+    from storage import close_connection, get_connection
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            create_database()
+            print(f"{'size':>8} {'store':>10} {'index':>10} {'embed':>10} {'load':>10} {'db added':>10}")
+            ingested = []
+            db_bytes = used_bytes(get_connection())
+            for size_kb in sizes_kb:
+                manual = make_bench_manual(size_kb)
+                conn = get_connection()
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT INTO manuals (equipment_name, manual_content) VALUES (?, '')",
+                    (f"bench-{size_kb}",)
+                )
+                equipment_id = cursor.lastrowid
+                timings = []
+                for step in (store_manual, index_manual, lambda c, e, _: index_vectors(c, e)):
+                    # Each step replaces its own output, so repeating it is safe
+                    timings.append(time_call(lambda: (step(cursor, equipment_id, manual), conn.commit())) * 1000)
+                timings.append(time_call(read_manual, equipment_id) * 1000)
+                db_mb = (used_bytes(conn) - db_bytes) / (1024 * 1024)
+                db_bytes += db_mb * 1024 * 1024
+                for name, timing in zip(("store", "index", "embed", "load"), timings):
+                    results[f"ingest/{size_kb}KB/{name}_ms"] = timing
+                results[f"ingest/{size_kb}KB/db_mb"] = db_mb
+                print(f"{size_kb:>6}KB " + " ".join(f"{t:>8.1f}ms" for t in timings) + f" {db_mb:>8.1f}MB")
+                ingested.append((size_kb, equipment_id))
+
+            print("\nChunk index (retrieve_issue_info):")
+            print(f"{'size':>8} " + " ".join(f"{len(q.split()):>7} kw" for q in QUESTIONS) + "  accuracy")
+            for size_kb, equipment_id in ingested:
+                timings = [time_call(retrieve_issue_info, question, equipment_id) * 1000 for question in QUESTIONS]
+                for question, timing in zip(QUESTIONS, timings):
+                    results[f"retrieve/{size_kb}KB/{len(question.split())}kw_ms"] = timing
+                score = accuracy(lambda question: retrieve_issue_info(question, equipment_id))
+                results[f"retrieve/{size_kb}KB/accuracy"] = score
+                print(f"{size_kb:>6}KB " + " ".join(f"{t:>8.1f}ms" for t in timings) + f"  {score:>8.0%}")
+
+            if latency is None:
+                return
+            print(f"\nEnd to end against a fake model ({latency}s per answer):")
+            print(f"{'size':>8} {'first tok':>10} {'total':>10}")
+            start_fake_model(latency)
+            for size_kb, equipment_id in ingested:
+                runs = [end_to_end(equipment_id, f"bench-{size_kb}", question) for question, _ in NEEDLES]
+                first_token = statistics.median(run[0] for run in runs)
+                total = statistics.median(run[1] for run in runs)
+                results[f"e2e/{size_kb}KB/first_token_ms"] = first_token
+                results[f"e2e/{size_kb}KB/total_ms"] = total
+                print(f"{size_kb:>6}KB {first_token:>8.1f}ms {total:>8.1f}ms")
+        finally:
+            close_connection()
+            os.chdir(cwd)
+
+
+def compare(results, baseline, threshold):
+    """Return descriptions of metrics that regressed against a baseline.
+
+    Timings and sizes regress when they grow by more than threshold
+    (a fraction) and by at least MIN_REGRESSION_MS; accuracy regresses
+    on any drop.
+    """
+    regressions = []
+    for name, value in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if name.endswith("accuracy"):
+            if value < base:
+                regressions.append(f"{name}: {base:.0%} -> {value:.0%}")
+        elif value > base * (1 + threshold) and (not name.endswith("_ms") or value - base >= MIN_REGRESSION_MS):
+            regressions.append(f"{name}: {base:.1f} -> {value:.1f} (+{(value / base - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AiLEAN retrieval, ingestion and end-to-end latency.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES_KB,
+                        help="Manual sizes to generate, in KB (default: 100KB to 50MB)")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Fake model seconds per answer for the end-to-end run")
+    parser.add_argument("--no-e2e", action="store_true", help="Skip the end-to-end run")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline JSON to compare against; exits 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Slowdown fraction counted as a regression (default: 0.2)")
+    args = parser.parse_args()
+
+    # Offline embeddings, a fake model and no answer cache, set before the chatbot is imported
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{FAKE_OLLAMA_PORT}"
+    os.environ.setdefault("AILEAN_EMBED_MODEL", "hashing")
+    os.environ["AILEAN_CACHE_SIZE"] = "0"
+    os.environ["AILEAN_CACHE_PERSIST"] = "0"
+
+    results = {}
+    print("Keyword lookup (offspring_chatbot.find_keyword_positions):")
+    bench_keyword_scan(args.sizes, results)
+    print("\nFull-text scan (offspring_chatbot.extract_issue_info):")
+    bench_extract(args.sizes, results)
+    print("\nSection map (maintenance_chatbot.extract_issue_info):")
+    bench_maintenance(args.sizes, results)
+    print("\nIngestion and DB load:")
+    bench_index(args.sizes, results, None if args.no_e2e else args.latency)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "sizes_kb": args.sizes,
+        "latency": args.latency,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.compare}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            raise SystemExit(1)
+        print(f"\nNo regressions against {args.compare}.")
+
+
+if __name__ == "__main__":
+    main()
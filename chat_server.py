@@ -0,0 +1,343 @@
+import argparse
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import llm_client
+import tracing
+from async_http import end_stream, send_event, send_json, send_response, serve, start_stream
+from conversation import Conversation
+from main_chatbot import init_database, load_manual_database, start_warm_up
+from offspring_chatbot import fast_response, generate_answer, open_manual, prepare_turn, stream_answer
+from response_cache import cache
+from storage import invalidate_catalog
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL = 60 * 60
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type",
+}
+
+
+async def single_token(text):
+    """Wrap a canned reply so it can be sent like a streamed one."""
+    yield text
+
+
+def traced(trace, func, *args):
+    """Run func on this (worker) thread with the request's trace current."""
+    with tracing.using(trace):
+        return func(*args)
+
+
+def traced_iterator(trace, make_iterator):
+    """Consume make_iterator() on this (worker) thread with the request's trace current."""
+    with tracing.using(trace):
+        yield from make_iterator()
+
+
+class Session:
+    """Conversation state for one web user."""
+
+    def __init__(self, session_id, equipment_id, equipment_name):
+        self.session_id = session_id
+        self.equipment_id = equipment_id
+        self.equipment_name = equipment_name
+        self.conversation = Conversation(equipment_name)
+        self.lock = asyncio.Lock()
+        self.last_seen = time.monotonic()
+
+
+class ChatServer:
+    """Serves /chat, /manuals, /stats and /metrics for chatbot_interface.html."""
+
+    def __init__(self, default_equipment=None, workers=32):
+        self.default_equipment = default_equipment
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # Questions for the model wait for a turn on the event loop, then run on their own
+        # threads, so queued generations never hold the threads fast replies and DB reads use
+        self.generation_slots = asyncio.Semaphore(llm_client.MAX_CONCURRENT_GENERATIONS)
+        self.generation_executor = ThreadPoolExecutor(max_workers=llm_client.MAX_CONCURRENT_GENERATIONS,
+                                                      thread_name_prefix="generation")
+        self.catalog = {}
+        self.manuals = {}
+        self.manual_locks = {}
+        self.sessions = {}
+
+    async def run_blocking(self, func, *args, executor=None):
+        """Run a blocking call (DB, Ollama) on the worker pool."""
+        return await asyncio.get_running_loop().run_in_executor(executor or self.executor, func, *args)
+
+    @asynccontextmanager
+    async def generation_turn(self, trace=tracing.NULL_TRACE):
+        """Wait on the event loop, not on a worker thread, until a generation may start."""
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.generation_slots.acquire(), llm_client.QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise llm_client.ModelBusyError("The model server is busy. Please try again in a moment.")
+        finally:
+            trace.record("queue_wait", time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self.generation_slots.release()
+
+    async def iterate_blocking(self, make_iterator, executor=None):
+        """Consume a blocking iterator on the worker pool, yielding its items asynchronously."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        finished = object()
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for item in make_iterator():
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+                    if stop.is_set():
+                        break
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+        producer = loop.run_in_executor(executor or self.executor, produce)
+        try:
+            while (item := await queue.get()) is not finished:
+                yield item
+        finally:
+            # Stop generating if the client went away mid-stream
+            stop.set()
+        await producer
+
+    async def refresh_catalog(self):
+        self.catalog = await self.run_blocking(load_manual_database)
+
+    async def resolve_equipment(self, requested):
+        """Map a requested equipment name (or the default) to (equipment_id, equipment_name)."""
+        name = requested or self.default_equipment
+        if not name and len(self.catalog) == 1:
+            name = next(iter(self.catalog))
+        if not name:
+            return None
+        for attempt in range(2):
+            for equipment_name, equipment_id in self.catalog.items():
+                if equipment_name.lower() == str(name).lower():
+                    return equipment_id, equipment_name
+            if attempt == 0:
+                # May have been added by another process, e.g. the ingest CLI
+                invalidate_catalog()
+                await self.refresh_catalog()
+        return None
+
+    async def get_manual(self, equipment_id):
+        """Return the cached open_manual result: (indexed, manual_content), or None."""
+        if equipment_id not in self.manuals:
+            lock = self.manual_locks.setdefault(equipment_id, asyncio.Lock())
+            async with lock:
+                if equipment_id not in self.manuals:
+                    self.manuals[equipment_id] = await self.run_blocking(open_manual, equipment_id)
+        return self.manuals[equipment_id]
+
+    async def get_session(self, session_id, requested_equipment):
+        """Return an existing session or start a new one."""
+        now = time.monotonic()
+        session = self.sessions.get(session_id)
+        if session and (not requested_equipment or requested_equipment.lower() == session.equipment_name.lower()):
+            session.last_seen = now
+            return session
+
+        for expired_id in [sid for sid, s in self.sessions.items() if now - s.last_seen > SESSION_TTL]:
+            del self.sessions[expired_id]
+        equipment = await self.resolve_equipment(requested_equipment)
+        if equipment is None:
+            return None
+        session = Session(session_id or uuid.uuid4().hex, *equipment)
+        self.sessions[session.session_id] = session
+        return session
+
+    async def handle_chat(self, request, writer):
+        try:
+            payload = request.json()
+        except ValueError:
+            await send_json(writer, 400, {"error": "Body must be JSON"}, CORS_HEADERS)
+            return
+        issue = str(payload.get("issue", "")).strip().lower()
+        if not issue:
+            await send_json(writer, 400, {"error": "Please enter an issue."}, CORS_HEADERS)
+            return
+        session = await self.get_session(payload.get("session_id"), payload.get("equipment"))
+        if session is None:
+            await send_json(writer, 404, {"error": "Unknown or unspecified equipment."}, CORS_HEADERS)
+            return
+
+        # Turns within one session run in order; different sessions run concurrently
+        stream = bool(payload.get("stream"))
+        async with session.lock:
+            intent, canned = None, None
+            opened = await self.get_manual(session.equipment_id)
+            if opened is None:
+                canned = f"Cannot proceed without {session.equipment_name} manual."
+            else:
+                _, manual_content = opened
+                # Small talk and FAQ lookups are answered without the model
+                intent, canned = await self.run_blocking(
+                    fast_response, issue, session.equipment_name, session.equipment_id, manual_content
+                )
+
+            if canned is not None:
+                response = canned
+                if stream:
+                    await self.send_stream(writer, session, single_token(canned))
+            else:
+                tokens = self.answer_tokens(session, issue, manual_content, stream)
+                if stream:
+                    response = await self.send_stream(writer, session, tokens)
+                else:
+                    response = "".join([token async for token in tokens])
+            if canned is None or intent == "faq":
+                session.conversation.add(issue, response)
+        if not stream:
+            await send_json(writer, 200, {"response": response, "session_id": session.session_id}, CORS_HEADERS)
+
+    async def answer_tokens(self, session, issue, manual_content, stream):
+        """Yield the model's answer to a question, streamed or as one piece.
+
+        Retrieval, the response-cache check and prompt building run on the
+        shared pool first, so a cached answer never waits behind running
+        generations; only the model call waits for a generation turn, and
+        that wait is the trace's queue_wait. Any failure ends the answer
+        with an "Error: ..." token, as in stream_response.
+        """
+        start = time.perf_counter()
+        trace = tracing.new_trace("stream" if stream else "response", equipment=session.equipment_name,
+                                  turn=len(session.conversation))
+        try:
+            cached, messages, cache_key = await self.run_blocking(
+                traced, trace, prepare_turn, issue, manual_content, session.equipment_name,
+                session.conversation, session.equipment_id
+            )
+            if cached is not None:
+                logger.info("%s: cached response in %.0f ms", session.equipment_name,
+                            (time.perf_counter() - start) * 1000)
+                yield cached
+                return
+            async with self.generation_turn(trace):
+                if not stream:
+                    yield await self.run_blocking(traced, trace, generate_answer, messages, cache_key,
+                                                  session.equipment_id, executor=self.generation_executor)
+                    return
+                tokens = self.iterate_blocking(lambda: traced_iterator(trace, lambda: stream_answer(
+                    messages, cache_key, session.equipment_name, session.equipment_id, start
+                )), executor=self.generation_executor)
+                try:
+                    async for token in tokens:
+                        yield token
+                finally:
+                    await tokens.aclose()
+        except Exception as e:
+            logger.error("%s: response failed: %s", session.equipment_name, e)
+            trace.set(error=str(e))
+            yield f"Error: {e}. Try again."
+        finally:
+            trace.finish()
+
+    async def send_stream(self, writer, session, tokens):
+        """Send tokens as server-sent events and return the full text.
+
+        Once the headers are out a failure can't become an error status,
+        so it is sent as an error event and the stream still ends cleanly.
+        """
+        await start_stream(writer, headers=CORS_HEADERS)
+        await send_event(writer, {"session_id": session.session_id})
+        parts = []
+        try:
+            async for token in tokens:
+                parts.append(token)
+                await send_event(writer, {"token": token})
+        except ConnectionError:
+            raise
+        except Exception as e:
+            await send_event(writer, {"error": f"Oops, something went wrong: {e}"})
+        finally:
+            await tokens.aclose()
+        await send_event(writer, {"done": True})
+        await end_stream(writer)
+        return "".join(parts)
+
+    async def handle_manuals(self, request, writer):
+        await self.refresh_catalog()
+        manuals = [{"equipment_id": equipment_id, "equipment_name": equipment_name}
+                   for equipment_name, equipment_id in self.catalog.items()]
+        await send_json(writer, 200, {"manuals": manuals, "default": self.default_equipment}, CORS_HEADERS)
+
+    async def handle_stats(self, request, writer):
+        await send_json(writer, 200, {"response_cache": cache.stats()}, CORS_HEADERS)
+
+    async def handle_metrics(self, request, writer):
+        """Serve the stage latency histograms for Prometheus (empty unless tracing is on)."""
+        await send_response(writer, 200, tracing.render_metrics().encode(),
+                            "text/plain; version=0.0.4", CORS_HEADERS)
+
+    async def handle(self, request, writer):
+        """Route one HTTP request."""
+        try:
+            if request.method == "OPTIONS":
+                await send_response(writer, 204, headers=CORS_HEADERS)
+            elif request.path == "/chat" and request.method == "POST":
+                await self.handle_chat(request, writer)
+            elif request.path == "/manuals" and request.method == "GET":
+                await self.handle_manuals(request, writer)
+            elif request.path == "/stats" and request.method == "GET":
+                await self.handle_stats(request, writer)
+            elif request.path == "/metrics" and request.method == "GET":
+                await self.handle_metrics(request, writer)
+            elif request.path in ("/chat", "/manuals", "/stats", "/metrics"):
+                await send_json(writer, 405, {"error": "Method not allowed"}, CORS_HEADERS)
+            else:
+                await send_json(writer, 404, {"error": "Not found"}, CORS_HEADERS)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            await send_json(writer, 500, {"error": f"Oops, something went wrong: {e}"}, CORS_HEADERS)
+
+    async def start(self, host="127.0.0.1", port=5000):
+        start_warm_up()
+        await self.run_blocking(init_database)
+        await self.refresh_catalog()
+        return await serve(self.handle, host, port)
+
+
+async def run(host, port, equipment, workers):
+    server = await ChatServer(equipment, workers).start(host, port)
+    print(f"AiLEAN chat server listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve AiLEAN over HTTP for chatbot_interface.html.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--equipment", help="Default manual for requests that don't name one")
+    parser.add_argument("--workers", type=int, default=32, help="Threads for DB reads and replies that skip the model")
+    parser.add_argument("--trace", action="store_true",
+                        help="Log a JSON latency breakdown per request and fill /metrics (same as AILEAN_TRACE=1)")
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    try:
+        asyncio.run(run(args.host, args.port, args.equipment, args.workers))
+    except KeyboardInterrupt:
+        print("\nGoodbye!")
+
+
+if __name__ == "__main__":
+    main()
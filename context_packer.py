@@ -0,0 +1,115 @@
+import os
+import re
+from bisect import bisect_left
+
+# Tokens of manual context per prompt; llama3.2 handles far more, but prefill time grows with it
+CONTEXT_TOKENS = int(os.environ.get("AILEAN_CONTEXT_TOKENS", "800"))
+MIN_CANDIDATE_CHARS = 50
+# No real token is longer than this, so a passage never needs more than budget * this many chars
+MAX_CHARS_PER_TOKEN = 8
+MAX_CONTEXT_CHARS = CONTEXT_TOKENS * MAX_CHARS_PER_TOKEN
+
+# Llama 3's pre-tokenizer split (as in tiktoken's cl100k), approximated without \p{...} classes
+PRE_TOKEN = re.compile(
+    r"'(?:s|t|re|ve|m|ll|d)|[^\r\n\w]?[^\W\d_]+|\d{1,3}| ?[^\s\w]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+",
+    re.IGNORECASE
+)
+# Words up to 7 letters are usually one BPE token; longer ones split roughly every 4 chars
+LONG_WORD = re.compile(r"[^\W\d_]{8,}")
+CHARS_PER_SUBTOKEN = 4
+# Stop packing once less than this much budget is left
+MIN_REMAINING_TOKENS = 32
+
+
+def estimate_tokens(text):
+    """Estimate Llama 3 token count: split like its tokenizer, then charge long words extra."""
+    count = len(PRE_TOKEN.findall(text))
+    for word in LONG_WORD.findall(text):
+        count += (len(word) - 1) // CHARS_PER_SUBTOKEN
+    return count
+
+
+def truncate_to_budget(text, budget_tokens):
+    """Cut text to roughly budget_tokens, at a word boundary."""
+    if estimate_tokens(text) <= budget_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    cut = text.rfind(" ", 0, low)
+    return text[:cut if cut > 0 else low].rstrip()
+
+
+def fit_to_budget(text, budget_tokens=CONTEXT_TOKENS):
+    """Trim a single passage to the context budget."""
+    return truncate_to_budget(text[:budget_tokens * MAX_CHARS_PER_TOKEN].strip(), budget_tokens)
+
+
+class Spans:
+    """Disjoint [start, end) spans kept sorted for O(log n) overlap checks."""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def uncovered(self, start, end):
+        """Return the largest part of [start, end) not already covered."""
+        index = bisect_left(self.starts, start)
+        if index > 0:
+            start = max(start, self.ends[index - 1])
+        best = (start, start)
+        while index < len(self.starts) and self.starts[index] < end:
+            if self.starts[index] - start > best[1] - best[0]:
+                best = (start, self.starts[index])
+            start = max(start, self.ends[index])
+            index += 1
+        if end - start > best[1] - best[0]:
+            best = (start, end)
+        return best
+
+    def add(self, start, end):
+        index = bisect_left(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+
+
+def pack_context(candidates, text_of, budget_tokens=CONTEXT_TOKENS):
+    """Fill a token budget with the best-scoring, non-overlapping passages.
+
+    candidates are (score, start, end) tuples over the manual's offsets;
+    text_of(start, end) returns a passage's text, and is only called for
+    passages that are considered. A passage overlapping one already
+    taken is cut to its uncovered part, or dropped if that is less than
+    half of it. Passages are returned best first. If even the best
+    passage is over budget, it is truncated to fit.
+    """
+    chosen = Spans()
+    passages = []
+    used = 0
+    for score, start, end in sorted(candidates, key=lambda c: (-c[0], c[1])):
+        free_start, free_end = chosen.uncovered(start, end)
+        if (free_end - free_start) * 2 < end - start:
+            continue
+        start, end = free_start, min(free_end, free_start + budget_tokens * MAX_CHARS_PER_TOKEN)
+        remaining = budget_tokens - used
+        if passages and end - start > remaining * MAX_CHARS_PER_TOKEN:
+            continue
+        text = text_of(start, end).strip()
+        if len(text) <= MIN_CANDIDATE_CHARS:
+            continue
+        tokens = estimate_tokens(text)
+        if tokens > remaining:
+            if passages:
+                continue
+            text = truncate_to_budget(text, budget_tokens)
+            tokens = budget_tokens
+        chosen.add(start, end)
+        passages.append(text)
+        used += tokens
+        if budget_tokens - used < MIN_REMAINING_TOKENS:
+            break
+    return "\n\n".join(passages)
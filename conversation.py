@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_client
+
+logger = logging.getLogger(__name__)
+
+# Turns kept word for word; older ones are folded into a running summary
+MAX_RECENT_TURNS = int(os.environ.get("AILEAN_RECENT_TURNS", "6"))
+# Turns left verbatim after a fold, so the prompt prefix then stays put for a few turns
+KEEP_AFTER_FOLD = max(1, MAX_RECENT_TURNS // 2)
+# Hard cap on verbatim turns while a summary is still being written
+MAX_PENDING_TURNS = 2 * MAX_RECENT_TURNS
+MAX_SUMMARY_CHARS = 1200
+SUMMARY_TOKENS = 160
+# Seconds a summary waits for a generation slot before settling for fallback_summary()
+SUMMARY_QUEUE_TIMEOUT = 5
+
+# Enough threads that sessions don't queue behind each other for every slot the model has
+_summarizer = ThreadPoolExecutor(max_workers=max(2, llm_client.MAX_CONCURRENT_GENERATIONS),
+                                 thread_name_prefix="summarizer")
+
+
+def summary_prompt(equipment_name, summary, turns):
+    """Build the prompt that folds turns into the running summary."""
+    transcript = "\n".join(f"User: {issue}\nBot: {response}" for issue, response in turns)
+    return (
+        f"Summarize this {equipment_name} troubleshooting conversation in at most three sentences. "
+        f"Keep the equipment details, symptoms, and fixes already tried; drop greetings and pleasantries.\n"
+        f"Summary so far: {summary or 'none'}\n"
+        f"New turns:\n{transcript}"
+    )
+
+
+def fallback_summary(summary, turns):
+    """Summarize without the model: keep what the user asked, newest last."""
+    asked = " ".join(f"User asked: {issue}." for issue, _ in turns)
+    return f"{summary} {asked}".strip()[-MAX_SUMMARY_CHARS:]
+
+
+class Conversation:
+    """Bounded conversation state for one chat: recent turns verbatim, older ones summarized.
+
+    Once MAX_RECENT_TURNS accumulate, the oldest are folded into the
+    summary on a background thread; they stay in the prompt verbatim
+    until the summary lands. If it is slow, history is still capped at
+    MAX_PENDING_TURNS: turns dropped before the summary covers them
+    are kept as a plain note (fallback_summary) instead. messages()
+    keeps the system prompt, summary and earlier turns in the same
+    order every turn, so Ollama can reuse their cached prefill.
+    """
+
+    def __init__(self, equipment_name):
+        self.equipment_name = equipment_name
+        self.summary = ""
+        self.turns = []
+        self.turn_count = 0
+        self.pending = False
+        # Leading turns covered by the summary in progress
+        self.folding = 0
+        # Turns dropped by the cap that the summary in progress doesn't cover
+        self.overflow = []
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.turn_count
+
+    def add(self, issue, response):
+        """Record a finished turn, folding older turns into the summary if needed."""
+        with self.lock:
+            self.turns.append((issue, response))
+            self.turn_count += 1
+            if self.pending:
+                # The summary is slow; drop the oldest turns rather than let history grow
+                excess = len(self.turns) - MAX_PENDING_TURNS
+                if excess > 0:
+                    covered = min(excess, self.folding)
+                    self.overflow.extend(self.turns[covered:excess])
+                    del self.turns[:excess]
+                    self.folding -= covered
+                return
+            if len(self.turns) <= MAX_RECENT_TURNS:
+                return
+            self.pending = True
+            self.folding = len(self.turns) - KEEP_AFTER_FOLD
+            summary, turns = self.summary, self.turns[:self.folding]
+        _summarizer.submit(self.fold, summary, turns)
+
+    def fold(self, summary, turns):
+        """Summarize turns (in the background) and drop them from the verbatim history."""
+        try:
+            response = llm_client.generate(
+                summary_prompt(self.equipment_name, summary, turns),
+                queue_timeout=SUMMARY_QUEUE_TIMEOUT,
+                options={"num_predict": SUMMARY_TOKENS}
+            )
+            new_summary = response['response'].strip()[:MAX_SUMMARY_CHARS]
+        except Exception as e:
+            logger.warning("Conversation summary failed, keeping a plain one: %s", e)
+            new_summary = fallback_summary(summary, turns)
+        with self.lock:
+            self.summary = fallback_summary(new_summary, self.overflow) if self.overflow else new_summary
+            self.overflow = []
+            del self.turns[:self.folding]
+            self.folding = 0
+            self.pending = False
+
+    def messages(self, system_prompt, user_message):
+        """Return chat messages: system prompt, summary and recent turns, then this turn."""
+        with self.lock:
+            summary, turns = self.summary, list(self.turns)
+            if self.overflow:
+                summary = fallback_summary(summary, self.overflow)
+        messages = [{"role": "system", "content": system_prompt}]
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the conversation so far: {summary}"})
+        for issue, response in turns:
+            messages.append({"role": "user", "content": issue})
+            messages.append({"role": "assistant", "content": response})
+        messages.append({"role": "user", "content": user_message})
+        return messages
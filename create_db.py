@@ -1,19 +1,36 @@
-import sqlite3
+from manual_index import index_missing_manuals
+from manual_store import store_missing_manuals
+from router import index_missing_terms
+from section_index import index_missing_sections
+from semantic_index import index_missing_vectors
+from storage import get_connection
+
+# Bring manuals stored by older versions up to date, in this order; every entry point runs these
+BACKFILLS = [
+    ("Compressed", store_missing_manuals),
+    ("Indexed", index_missing_manuals),
+    ("Section-indexed", index_missing_sections),
+    ("Counted routing terms for", index_missing_terms),
+]
+
+def backfill_manuals(cursor):
+    """Run every backfill; returns [(label, manuals updated)]."""
+    return [(label, backfill(cursor)) for label, backfill in BACKFILLS]
 
 def create_database():
-    conn = sqlite3.connect("military_manuals.db")
+    # Opening the database creates or migrates the schema; the rest backfills indexes
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS manuals (
-            equipment_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            equipment_name TEXT NOT NULL UNIQUE,
-            manual_content TEXT NOT NULL
-        )
-    """)
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_equipment_name ON manuals (equipment_name)")
+    counts = backfill_manuals(cursor)
+    conn.commit()
+    embedded = index_missing_vectors(cursor)
     conn.commit()
-    conn.close()
+    for label, count in counts:
+        if count:
+            print(f"{label} {count} existing manual(s).")
+    if embedded:
+        print(f"Embedded {embedded} manual(s) for semantic search.")
     print("Database created successfully!")
 
 if __name__ == "__main__":
-    create_database()
\ No newline at end of file
+    create_database()
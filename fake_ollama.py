@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import json
+from datetime import datetime, timezone
+
+from async_http import end_stream, send_chunk, send_json, serve, start_stream
+from semantic_index import hashing_embedder
+
+FAKE_REPLY = "Check the part, clean it, and try again. You've got this."
+
+
+def reply_fields(path, text):
+    """Return the fields carrying generated text for /api/generate or /api/chat."""
+    if path == "/api/chat":
+        return {"message": {"role": "assistant", "content": text}}
+    return {"response": text}
+
+
+def make_handler(latency):
+    """Build a request handler that answers like Ollama after `latency` seconds."""
+
+    async def handle(request, writer):
+        if request.method != "POST":
+            await send_json(writer, 405, {"error": "method not allowed"})
+            return
+        payload = request.json()
+        if request.path in ("/api/generate", "/api/chat") and payload.get("stream"):
+            # Spread the generation time evenly over the tokens, like a real model
+            tokens = [word + " " for word in FAKE_REPLY.split()]
+            await start_stream(writer, content_type="application/x-ndjson")
+            for token in tokens:
+                await asyncio.sleep(latency / len(tokens))
+                await send_chunk(writer, json.dumps({
+                    "model": payload.get("model", ""),
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    **reply_fields(request.path, token),
+                    "done": False,
+                }) + "\n")
+            await send_chunk(writer, json.dumps({
+                "model": payload.get("model", ""),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                **reply_fields(request.path, ""),
+                "done": True,
+                "eval_count": len(tokens),
+                "eval_duration": int(latency * 1e9),
+            }) + "\n")
+            await end_stream(writer)
+        elif request.path in ("/api/generate", "/api/chat"):
+            await asyncio.sleep(latency)
+            await send_json(writer, 200, {
+                "model": payload.get("model", ""),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                **reply_fields(request.path, FAKE_REPLY),
+                "done": True,
+                "eval_count": len(FAKE_REPLY.split()),
+                "eval_duration": int(latency * 1e9),
+            })
+        elif request.path == "/api/embed":
+            texts = payload.get("input", [])
+            texts = [texts] if isinstance(texts, str) else texts
+            await send_json(writer, 200, {
+                "model": payload.get("model", ""),
+                "embeddings": hashing_embedder(texts).tolist(),
+            })
+        else:
+            await send_json(writer, 404, {"error": f"unknown endpoint {request.path}"})
+
+    return handle
+
+
+async def start_fake_ollama(host="127.0.0.1", port=11500, latency=0.5):
+    """Start a fake Ollama server in the running event loop."""
+    return await serve(make_handler(latency), host, port)
+
+
+async def run(host, port, latency):
+    server = await start_fake_ollama(host, port, latency)
+    print(f"Fake Ollama listening on http://{host}:{port} ({latency}s per generation)")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve canned Ollama responses for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per generation")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.host, args.port, args.latency))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import os
+import time
+
+from manual_index import index_manual
+from manual_store import store_manual
+from pdf_text import count_pages, extract_pages, file_sha256, join_pages
+from router import index_terms
+from semantic_index import index_vectors
+from storage import get_connection, invalidate_catalog
+
+
+def ingest_pdf(file_path, equipment_name, replace=False, workers=None):
+    """Extract, store and index one PDF manual.
+
+    Unchanged files (same path and content hash) are skipped. Pages are
+    committed as they are extracted, so an interrupted run resumes.
+    With replace=True an existing manual of the same name is updated
+    in place. Returns (status, equipment_id) where status is 'added',
+    'updated', 'unchanged', 'exists' or 'empty'.
+    """
+    file_hash = file_sha256(file_path)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT equipment_id FROM manuals WHERE equipment_name = ?", (equipment_name,))
+        existing = cursor.fetchone()
+        if existing:
+            cursor.execute(
+                "SELECT 1 FROM ingested_files WHERE file_path = ? AND file_hash = ? AND equipment_id = ?",
+                (os.path.abspath(file_path), file_hash, existing[0])
+            )
+            if cursor.fetchone():
+                return 'unchanged', existing[0]
+            if not replace:
+                return 'exists', existing[0]
+
+        # Resume: only extract pages not already staged for this exact file content
+        cursor.execute("SELECT page_no FROM ingest_pages WHERE file_hash = ?", (file_hash,))
+        staged = {row[0] for row in cursor.fetchall()}
+        page_count = count_pages(file_path)
+        remaining = [page_no for page_no in range(page_count) if page_no not in staged]
+        for batch in extract_pages(file_path, remaining, workers):
+            cursor.executemany(
+                "INSERT OR REPLACE INTO ingest_pages (file_hash, page_no, text) VALUES (?, ?, ?)",
+                ((file_hash, page_no, text) for page_no, text in batch)
+            )
+            conn.commit()
+
+        cursor.execute("SELECT page_no, text FROM ingest_pages WHERE file_hash = ?", (file_hash,))
+        text = join_pages(cursor.fetchall())
+        if not text:
+            return 'empty', None
+
+        if existing:
+            equipment_id = existing[0]
+            status = 'updated'
+        else:
+            cursor.execute("INSERT INTO manuals (equipment_name, manual_content) VALUES (?, '')", (equipment_name,))
+            equipment_id = cursor.lastrowid
+            status = 'added'
+        # Index first: unindexing the old chunks reads the old text back
+        index_manual(cursor, equipment_id, text)
+        store_manual(cursor, equipment_id, text)
+        index_terms(cursor, equipment_id, text)
+        cursor.execute(
+            "INSERT OR REPLACE INTO ingested_files (file_path, file_hash, equipment_id, page_count, ingested_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (os.path.abspath(file_path), file_hash, equipment_id, page_count, time.time())
+        )
+        cursor.execute("DELETE FROM ingest_pages WHERE file_hash = ?", (file_hash,))
+        conn.commit()
+        if status == 'added':
+            invalidate_catalog()
+
+        # Embed chunks once at ingestion; keyword search still works if this fails
+        try:
+            index_vectors(cursor, equipment_id)
+            conn.commit()
+        except Exception as e:
+            print(f"Warning: could not embed '{equipment_name}' for semantic search: {e}")
+        return status, equipment_id
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def ingest_directory(directory, workers=None):
+    """Ingest every PDF in a directory, naming each manual after its file."""
+    results = {}
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(".pdf"):
+            continue
+        file_path = os.path.join(directory, name)
+        equipment_name = os.path.splitext(name)[0]
+        start = time.perf_counter()
+        try:
+            status, _ = ingest_pdf(file_path, equipment_name, replace=True, workers=workers)
+        except Exception as e:
+            status = f"error: {e}"
+        results[file_path] = status
+        print(f"{status:>10}  {equipment_name}  ({time.perf_counter() - start:.1f}s)")
+    return results
+
+
+def main():
+    from main_chatbot import init_database
+
+    parser = argparse.ArgumentParser(description="Ingest PDF manuals into the AiLEAN database.")
+    parser.add_argument("paths", nargs="+", help="PDF files or directories of PDFs")
+    parser.add_argument("--workers", type=int, help="Extraction processes (default: CPU count)")
+    args = parser.parse_args()
+
+    init_database()
+    for path in args.paths:
+        if os.path.isdir(path):
+            ingest_directory(path, args.workers)
+        else:
+            equipment_name = os.path.splitext(os.path.basename(path))[0]
+            status, _ = ingest_pdf(path, equipment_name, replace=True, workers=args.workers)
+            print(f"{status:>10}  {equipment_name}")
+
+
+if __name__ == "__main__":
+    main()
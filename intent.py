@@ -0,0 +1,198 @@
+import argparse
+import math
+import re
+from collections import Counter
+
+from manual_index import query_terms
+from manual_store import read_manual_range
+from section_index import ISSUE, best_section, find_sections, load_sections, sections_for_text
+from storage import get_connection, manual_catalog
+
+# Inputs made only of small-talk words get a canned reply; intents are tried in this order
+SMALL_TALK = {
+    "thanks": {"thanks", "thank", "thx", "ty", "appreciate", "appreciated", "cheers"},
+    "greeting": {"hi", "hello", "hey", "howdy", "morning", "afternoon", "evening"},
+    "acknowledge": {"ok", "okay", "k", "got", "cool", "great", "good", "perfect", "understood",
+                    "roger", "copy", "alright", "nice", "awesome", "sounds"},
+}
+# Words that may pad small talk ("thank you so much") without making it a question
+SMALL_TALK_FILLER = {"you", "it", "so", "much", "very", "a", "lot", "all", "that", "there", "sir", "guys", "again"}
+SMALL_TALK_WORDS = set().union(SMALL_TALK_FILLER, *SMALL_TALK.values())
+MAX_SMALL_TALK_WORDS = 6
+
+# Minimum TF-IDF cosine similarity for an FAQ to answer a question on its own
+FAQ_THRESHOLD = 0.7
+# Sections longer than this are too broad to send as an answer; such questions go to the model
+MAX_FAQ_CHARS = 2500
+ISSUE_PREFIX = re.compile(r"^issue:\s*", re.IGNORECASE)
+# FAQ models kept in memory, one per section index
+MAX_MODELS = 64
+
+_models = {}
+
+
+def small_talk_intent(issue):
+    """Return 'thanks', 'greeting' or 'acknowledge' if the input is only small talk, else None."""
+    words = re.findall(r"[a-z']+", issue.lower())
+    if not words or len(words) > MAX_SMALL_TALK_WORDS or not SMALL_TALK_WORDS.issuperset(words):
+        return None
+    for intent, intent_words in SMALL_TALK.items():
+        if intent_words.intersection(words):
+            return intent
+    return None
+
+
+class FaqModel:
+    """TF-IDF vectors of one manual's FAQ questions, matched against incoming questions."""
+
+    def __init__(self, entries):
+        self.entries = entries
+        term_lists = [query_terms(question) for question, _ in entries]
+        document_counts = Counter(term for terms in term_lists for term in terms)
+        self.idf = {term: math.log((len(entries) + 1) / (count + 1)) + 1 for term, count in document_counts.items()}
+        # Terms no FAQ uses (e.g. the equipment's name) weigh as little as the commonest ones
+        self.unseen_idf = 1.0
+        self.vectors = [self.vector(terms) for terms in term_lists]
+        self.postings = {}
+        for i, terms in enumerate(term_lists):
+            for term in terms:
+                self.postings.setdefault(term, []).append(i)
+
+    def vector(self, terms):
+        weights = {term: self.idf.get(term, self.unseen_idf) for term in terms}
+        return weights, math.sqrt(sum(w * w for w in weights.values())) or 1.0
+
+    def match(self, issue):
+        """Return the section of the closest FAQ covering every term it asks about, or None."""
+        terms = query_terms(issue)
+        weights, norm = self.vector(terms)
+        best, best_score = None, FAQ_THRESHOLD
+        for i in {i for term in terms for i in self.postings.get(term, ())}:
+            faq_weights, faq_norm = self.vectors[i]
+            if not faq_weights.keys() <= weights.keys():
+                continue
+            score = sum(w * weights[term] for term, w in faq_weights.items()) / (norm * faq_norm)
+            if score >= best_score:
+                best, best_score = self.entries[i][1], score
+        return best
+
+
+def load_faqs(equipment_id):
+    """Return a manual's curated (question, heading) pairs."""
+    if equipment_id is None:
+        return []
+    try:
+        cursor = get_connection().cursor()
+        cursor.execute("SELECT question, heading FROM manual_faqs WHERE equipment_id = ?", (equipment_id,))
+        return cursor.fetchall()
+    except Exception as e:
+        print(f"Error loading FAQs: {e}")
+        return []
+
+
+def faq_entries(sections, equipment_id):
+    """Collect (question, section) pairs: every Issue: block, plus the curated FAQs."""
+    # An issue can appear more than once (e.g. in the contents); best_section picks the real one
+    issues = {}
+    for section in sections:
+        if section.level == ISSUE:
+            issues.setdefault(ISSUE_PREFIX.sub("", section.heading), []).append(section)
+    matches = {question: best_section(found) for question, found in issues.items()}
+    for question, heading in load_faqs(equipment_id):
+        matches[question] = best_section(find_sections(sections, heading))
+    return [
+        (question, section) for question, section in matches.items()
+        if section and section.end - section.start <= MAX_FAQ_CHARS and query_terms(question)
+    ]
+
+
+def faq_model(sections, equipment_id):
+    """Return the FAQ model for a section index, building it on first use.
+
+    Models are keyed by the index object, so a re-indexed manual (whose
+    sections are loaded afresh) gets a new model.
+    """
+    cached = _models.get(id(sections))
+    if cached and cached[0] is sections:
+        return cached[1]
+    if len(_models) >= MAX_MODELS:
+        _models.clear()
+    model = FaqModel(faq_entries(sections, equipment_id))
+    _models[id(sections)] = (sections, model)
+    return model
+
+
+def classify(issue, equipment_id=None, manual_content=None):
+    """Sort an input into small talk, an FAQ lookup or troubleshooting for the model.
+
+    Returns (intent, section); section is set only for 'faq'. Unindexed
+    manuals are passed in as manual_content, as elsewhere.
+    """
+    intent = small_talk_intent(issue)
+    if intent:
+        return intent, None
+    if manual_content is not None:
+        sections = sections_for_text(manual_content)
+    elif equipment_id is not None:
+        sections = load_sections(equipment_id)
+    else:
+        sections = None
+    if sections:
+        section = faq_model(sections, equipment_id).match(issue)
+        if section:
+            return "faq", section
+    return "troubleshooting", None
+
+
+def section_text(section, equipment_id=None, manual_content=None):
+    """Return a section's text from the manual in memory or the stored blocks."""
+    if manual_content is not None:
+        return manual_content[section.start:section.end].strip()
+    return read_manual_range(equipment_id, section.start, section.end).strip()
+
+
+def add_faq(cursor, equipment_id, question, heading):
+    """Point a question at the section with this heading, replacing any earlier answer."""
+    cursor.execute(
+        "INSERT OR REPLACE INTO manual_faqs (equipment_id, question, heading) VALUES (?, ?, ?)",
+        (equipment_id, question, heading)
+    )
+    _models.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the FAQs answered straight from a manual.")
+    parser.add_argument("equipment", help="Equipment name as listed in the menu")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add = subparsers.add_parser("add", help="Answer a question with a manual section")
+    add.add_argument("question")
+    add.add_argument("heading", help="Text of the section heading, e.g. 'Issue: Failure to Feed'")
+    subparsers.add_parser("list", help="List the questions answered without the model")
+    ask = subparsers.add_parser("ask", help="Show how a question would be classified")
+    ask.add_argument("question")
+    args = parser.parse_args()
+
+    catalog = {name.lower(): equipment_id for name, equipment_id in manual_catalog().items()}
+    equipment_id = catalog.get(args.equipment.lower())
+    if equipment_id is None:
+        print(f"Error: No manual named '{args.equipment}'")
+        return
+    sections = load_sections(equipment_id)
+    if args.command == "add":
+        if not find_sections(sections, args.heading):
+            print(f"Error: No section heading contains '{args.heading}'")
+            return
+        conn = get_connection()
+        add_faq(conn.cursor(), equipment_id, args.question, args.heading)
+        conn.commit()
+        print(f"Added: '{args.question}' -> {args.heading}")
+    elif args.command == "list":
+        for question, section in faq_model(sections, equipment_id).entries:
+            print(f"{question} -> {section.heading} ({section.end - section.start} chars)")
+    else:
+        intent, section = classify(args.question, equipment_id)
+        print(intent if section is None else f"{intent}: {section.heading}")
+
+
+if __name__ == "__main__":
+    main()
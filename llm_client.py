@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from tracing import current_trace
+
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+MODEL = os.environ.get("AILEAN_MODEL", "llama3.2:latest")
+# Seconds to wait for Ollama to respond (per read, so long generations that stream still work)
+REQUEST_TIMEOUT = float(os.environ.get("AILEAN_REQUEST_TIMEOUT", "120"))
+CONNECT_TIMEOUT = 5.0
+# Generations allowed in flight at once; size this to the GPU
+MAX_CONCURRENT_GENERATIONS = int(os.environ.get("AILEAN_MAX_GENERATIONS", "2"))
+# Seconds a request may wait for a free generation slot before giving up
+QUEUE_TIMEOUT = float(os.environ.get("AILEAN_QUEUE_TIMEOUT", "300"))
+# How long Ollama keeps the model loaded after a request (Ollama's own default is 5m)
+KEEP_ALIVE = os.environ.get("AILEAN_KEEP_ALIVE", "30m")
+
+_client = None
+_client_lock = threading.Lock()
+_generation_slots = threading.BoundedSemaphore(MAX_CONCURRENT_GENERATIONS)
+
+
+class ModelBusyError(RuntimeError):
+    """Raised when no generation slot frees up within QUEUE_TIMEOUT."""
+
+
+def get_client():
+    """Return the shared Ollama client, creating it on first use.
+
+    One client means one httpx connection pool, so keep-alive
+    connections to the model server are reused across questions.
+    ollama and httpx are imported here, on first use, so paths that
+    never reach the model don't pay for them at startup.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import httpx
+                import ollama
+                _client = ollama.Client(
+                    host=OLLAMA_HOST,
+                    timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+                    limits=httpx.Limits(max_connections=MAX_CONCURRENT_GENERATIONS + 8,
+                                        max_keepalive_connections=MAX_CONCURRENT_GENERATIONS + 8),
+                )
+    return _client
+
+
+@contextmanager
+def generation_slot(timeout=QUEUE_TIMEOUT):
+    """Hold one of the MAX_CONCURRENT_GENERATIONS slots, queueing up to timeout seconds if all are busy."""
+    start = time.perf_counter()
+    acquired = _generation_slots.acquire(timeout=timeout)
+    current_trace().record("queue_wait", time.perf_counter() - start)
+    if not acquired:
+        raise ModelBusyError("The model server is busy. Please try again in a moment.")
+    try:
+        yield
+    finally:
+        _generation_slots.release()
+
+
+def generate(prompt, model=None, queue_timeout=QUEUE_TIMEOUT, **kwargs):
+    """Run one non-streaming generation and return Ollama's response."""
+    with generation_slot(queue_timeout):
+        return get_client().generate(model=model or MODEL, prompt=prompt, keep_alive=KEEP_ALIVE, **kwargs)
+
+
+def generate_stream(prompt, model=None, **kwargs):
+    """Run one streaming generation, yielding Ollama's response chunks.
+
+    The generation slot is held until the stream is exhausted or closed.
+    """
+    with generation_slot():
+        yield from get_client().generate(model=model or MODEL, prompt=prompt, stream=True,
+                                       keep_alive=KEEP_ALIVE, **kwargs)
+
+
+def chat(messages, model=None, **kwargs):
+    """Run one non-streaming chat turn and return Ollama's response."""
+    with generation_slot():
+        return get_client().chat(model=model or MODEL, messages=messages, keep_alive=KEEP_ALIVE, **kwargs)
+
+
+def chat_stream(messages, model=None, **kwargs):
+    """Run one streaming chat turn, yielding Ollama's response chunks.
+
+    The generation slot is held until the stream is exhausted or closed.
+    """
+    with generation_slot():
+        yield from get_client().chat(model=model or MODEL, messages=messages, stream=True,
+                                   keep_alive=KEEP_ALIVE, **kwargs)
+
+
+def warm_up(model=None):
+    """Load the model into Ollama's memory without generating; returns seconds taken.
+
+    An empty prompt makes Ollama load the model and return at once, so
+    the first real question doesn't pay the load time.
+    """
+    start = time.perf_counter()
+    get_client().generate(model=model or MODEL, prompt="", keep_alive=KEEP_ALIVE)
+    return time.perf_counter() - start
+
+
+def embed(texts, model):
+    """Embed a batch of texts with an Ollama embedding model."""
+    return get_client().embed(model=model, input=texts, keep_alive=KEEP_ALIVE)['embeddings']
@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+FAKE_OLLAMA_PORT = 11500
+QUESTIONS = [
+    "how do I clean the bolt",
+    "my weapon has a failure to feed",
+    "what is the firing sequence",
+    "the trigger is stuck",
+]
+
+
+def prepare_database(manual_kb):
+    """Create a database with one synthetic manual in the current directory."""
+    from benchmark import make_manual
+    from create_db import create_database
+    from storage import get_connection
+
+    conn = get_connection()
+    conn.execute("INSERT INTO manuals (equipment_name, manual_content) VALUES (?, ?)",
+                 ("Load Test", make_manual(manual_kb * 1024)))
+    conn.commit()
+    create_database()
+
+
+async def simulate_user(host, port, turns, latencies):
+    """Run one user's conversation, recording each request's latency."""
+    from async_http import request_json
+
+    session_id = None
+    for turn in range(turns):
+        start = time.perf_counter()
+        status, body = await request_json(host, port, "POST", "/chat", {
+            "issue": QUESTIONS[turn % len(QUESTIONS)],
+            "session_id": session_id,
+        })
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            raise RuntimeError(f"/chat returned {status}: {body}")
+        session_id = body["session_id"]
+
+
+async def run_load_test(users, turns, latency, port):
+    from chat_server import ChatServer
+    from fake_ollama import start_fake_ollama
+
+    fake = await start_fake_ollama(port=FAKE_OLLAMA_PORT, latency=latency)
+    server = await ChatServer("Load Test", workers=users).start("127.0.0.1", port)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(simulate_user("127.0.0.1", port, turns, latencies) for _ in range(users)))
+    elapsed = time.perf_counter() - start
+    server.close()
+    fake.close()
+
+    latencies.sort()
+    print(f"{users} users x {turns} turns against a {latency}s fake model")
+    print(f"  total: {elapsed:.2f}s  throughput: {len(latencies) / elapsed:.1f} req/s")
+    print(f"  p50: {statistics.median(latencies) * 1000:.0f}ms  "
+          f"p95: {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f}ms  "
+          f"max: {latencies[-1] * 1000:.0f}ms")
+    print(f"  serial would take: {users * turns * latency:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the AiLEAN chat server against a fake Ollama.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=4, help="Questions per user session")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake generation time in seconds")
+    parser.add_argument("--manual-kb", type=int, default=500, help="Size of the synthetic manual")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--max-generations", type=int, default=8,
+                        help="Concurrent generations allowed against the fake model")
+    args = parser.parse_args()
+
+    # Point the chatbot at the fake server (and offline embeddings) before it is imported
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{FAKE_OLLAMA_PORT}"
+    os.environ.setdefault("AILEAN_EMBED_MODEL", "hashing")
+    os.environ["AILEAN_MAX_GENERATIONS"] = str(args.max_generations)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            prepare_database(args.manual_kb)
+            asyncio.run(run_load_test(args.users, args.turns, args.latency, args.port))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,65 @@
-import sqlite3
+import time
+
+# Taken before the other imports so the startup report includes them
+STARTED = time.perf_counter()
+
+import argparse
+import logging
 import os
-import PyPDF2
-from offspring_chatbot import run_offspring_chatbot
+import threading
+
+import llm_client
+import semantic_index
+import tracing
+from conversation import Conversation
+from create_db import backfill_manuals
+from ingest import ingest_pdf
+from offspring_chatbot import fast_response, open_manual, print_stream, run_offspring_chatbot, stream_response
+from router import route
+from storage import get_connection, manual_catalog
+
+logger = logging.getLogger(__name__)
 
 
 def init_database():
-    """Initialize SQLite database for manuals."""
-    conn = sqlite3.connect("military_manuals.db")
+    """Initialize SQLite database for manuals.
+
+    Opening the database migrates its schema; this also runs the same
+    backfills as create_db.py, so manuals stored by older versions get
+    compressed blocks and chunk, section and routing indexes.
+    """
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS manuals (
-            equipment_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            equipment_name TEXT NOT NULL UNIQUE,
-            manual_content TEXT NOT NULL
-        )
-    """)
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_equipment_name ON manuals (equipment_name)")
+    backfill_manuals(cursor)
     conn.commit()
-    conn.close()
+
+
+def warm_up_models():
+    """Have Ollama load the chat and embedding models, logging how long that took."""
+    start = time.perf_counter()
+    try:
+        llm_client.warm_up()
+        semantic_index.warm_up()
+        logger.info("models warm in %.0f ms", (time.perf_counter() - start) * 1000)
+    except Exception as e:
+        logger.warning("model warm-up failed: %s", e)
+
+
+def start_warm_up():
+    """Warm the models up on a background thread while startup carries on.
+
+    Failures (e.g. Ollama not running yet) are only logged; the first
+    question reports them if they persist.
+    """
+    thread = threading.Thread(target=warm_up_models, name="model-warm-up", daemon=True)
+    thread.start()
+    return thread
 
 
 def load_manual_database():
-    """Load available manuals from the database."""
+    """Load available manuals from the database (cached until a manual is added)."""
     try:
-        conn = sqlite3.connect("military_manuals.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT equipment_id, equipment_name FROM manuals")
-        manuals = cursor.fetchall()
-        conn.close()
-        return {row[1]: row[0] for row in manuals}
+        return manual_catalog()
     except Exception as e:
         print(f"Error loading manual database: {e}")
         return {}
@@ -47,46 +78,46 @@ def add_new_manual():
         print("Error: Equipment name cannot be empty.")
         return None
 
-    # Extract text from PDF
+    # Extract pages in parallel, store and index the manual
     try:
-        with open(file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                extracted = page.extract_text()
-                if extracted:
-                    text += extracted
-            if not text:
-                print("Error: No text extracted from PDF.")
-                return None
+        status, equipment_id = ingest_pdf(file_path, equipment_name)
     except Exception as e:
-        print(f"Error reading PDF: {e}")
+        print(f"Error adding manual: {e}")
         return None
-
-    # Save to database
-    try:
-        conn = sqlite3.connect("military_manuals.db")
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT OR IGNORE INTO manuals (equipment_name, manual_content) VALUES (?, ?)",
-            (equipment_name, text)
-        )
-        conn.commit()
-        if cursor.rowcount == 0:
-            conn.close()
-            print(f"Error: A manual for '{equipment_name}' already exists.")
-            return None
-
-        # Get the ID of the newly inserted manual
-        cursor.execute("SELECT equipment_id FROM manuals WHERE equipment_name = ?", (equipment_name,))
-        equipment_id = cursor.fetchone()[0]
-        conn.close()
-
-        print(f"Manual for '{equipment_name}' added successfully!")
-        return equipment_id, equipment_name
-    except Exception as e:
-        print(f"Error adding manual to database: {e}")
+    if status == 'empty':
+        print("Error: No text extracted from PDF.")
         return None
+    if status in ('exists', 'unchanged'):
+        print(f"Error: A manual for '{equipment_name}' already exists.")
+        return None
+
+    print(f"Manual for '{equipment_name}' added successfully!")
+    return equipment_id, equipment_name
+
+
+def ask_any_manual():
+    """Route a free-form question to the best one or two manuals and answer from each."""
+    issue = input("\nDescribe the problem: ").strip().lower()
+    if not issue:
+        print("Error: Please describe the problem.")
+        return
+    routes = route(issue)
+    if not routes:
+        print("No manual matches that. Try naming the equipment, or pick a manual from the list.")
+        return
+
+    for equipment_id, equipment_name in routes:
+        opened = open_manual(equipment_id)
+        if opened is None:
+            continue
+        _, manual_content = opened
+        print(f"\nFrom the {equipment_name} manual:")
+        _, response = fast_response(issue, equipment_name, equipment_id, manual_content)
+        if response:
+            print(f"\n{response}\n")
+        else:
+            print_stream(stream_response(issue, manual_content, equipment_name, Conversation(equipment_name), equipment_id))
+    print(f"To keep troubleshooting, select {routes[0][1]} from the list.")
 
 
 def display_available_manuals(database):
@@ -104,6 +135,7 @@ def get_user_choice(database):
     """Get user's choice for manual selection or adding new manual."""
     print("\nOptions:")
     print("• Type the name of an existing manual to select it")
+    print("• Type 'ask' to describe a problem without picking a manual")
     print("• Type 'add' to upload a new manual")
     print("• Type 'exit' to quit")
 
@@ -113,6 +145,8 @@ def get_user_choice(database):
         return 'exit', None, None
     elif choice.lower() == 'add':
         return 'add', None, None
+    elif choice.lower() == 'ask':
+        return 'ask', None, None
     else:
         # Check if it's a manual name or number
         equipment_list = list(database.keys())
@@ -139,12 +173,44 @@ def get_user_choice(database):
 
 def main():
     """Run the main chatbot interface."""
+    parser = argparse.ArgumentParser(description="AiLEAN, the Universal Military Maintenance Bot.")
+    parser.add_argument("--trace", action="store_true",
+                        help="Log a JSON latency breakdown per question to ailean.log (same as AILEAN_TRACE=1)")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="On exit, write the stage latency histograms to FILE in Prometheus text format")
+    parser.add_argument("--no-warm-up", action="store_true",
+                        help="Don't preload the model at startup (e.g. when Ollama is started later)")
+    args = parser.parse_args()
+    logging.basicConfig(filename="ailean.log", level=logging.INFO,
+                        format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    if args.trace or args.metrics:
+        tracing.enable()
+    try:
+        run_menu(warm_up=not args.no_warm_up)
+    finally:
+        if args.metrics:
+            with open(args.metrics, "w") as file:
+                file.write(tracing.render_metrics())
+
+
+def run_menu(warm_up=True):
+    """Show the manual menu until the user exits.
+
+    The model is loaded in the background while the database opens and
+    the menu waits for input, so the first answer isn't held up by it.
+    """
+    imported = time.perf_counter()
+    if warm_up:
+        start_warm_up()
     init_database()
+    ready = time.perf_counter()
+    logger.info("startup: imports %.0f ms, database %.0f ms, menu ready %.0f ms after start",
+                (imported - STARTED) * 1000, (ready - imported) * 1000, (ready - STARTED) * 1000)
     print("Welcome to AiLEAN, your Universal Military Maintenance Bot!")
 
     while True:
         try:
-            # Load current database
+            # Current manuals (cached; re-read only after one is added)
             database = load_manual_database()
 
             # Display available manuals
@@ -159,6 +225,8 @@ def main():
             elif action == 'select':
                 print(f"\nLaunching AiLEAN for {equipment_name}...")
                 run_offspring_chatbot(equipment_id, equipment_name)
+            elif action == 'ask':
+                ask_any_manual()
             elif action == 'add':
                 result = add_new_manual()
                 if result:
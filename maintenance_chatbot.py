@@ -1,61 +1,71 @@
-import ollama
+import logging
 import os
-import PyPDF2
+import time
+
+import llm_client
+from context_packer import fit_to_budget
+from section_index import CHAPTER, ISSUE, best_section, find_sections, parse_sections
+from text_cache import byte_span, load_cached_text
+
+logger = logging.getLogger(__name__)
+
+ISSUE_KEYWORDS = {
+    "failure to fire": "Issue: Failure to Fire",
+    "failure to feed": "Issue: Failure to Feed",
+    "clean": "Cleaning:",
+}
+
+def build_section_map(text):
+    """Locate each issue section, the troubleshooting section and the intro once per manual."""
+    sections = parse_sections(text)
+    section_map = {}
+    for keyword, manual_section in ISSUE_KEYWORDS.items():
+        matches = find_sections(sections, manual_section)
+        if matches:
+            section_map[keyword] = byte_span(text, matches[0].start, matches[0].end)
+            continue
+        # Not a parsed heading (e.g. "Cleaning:"): run to the next issue or chapter
+        start_idx = text.lower().find(manual_section.lower())
+        if start_idx != -1:
+            following = [s.start for s in sections if s.start > start_idx and s.level in (CHAPTER, ISSUE)]
+            section_map[keyword] = byte_span(text, start_idx, following[0] if following else len(text))
+    section = best_section(find_sections(sections, "troubleshooting"))
+    if section:
+        section_map["troubleshooting"] = byte_span(text, section.start, section.end)
+    section_map["intro"] = byte_span(text, 0, 2000)
+    return section_map
 
 def load_manual(file_path):
-    """Load the maintenance manual from a PDF."""
+    """Load the maintenance manual, parsing the PDF only if its text cache is stale."""
     if not os.path.exists(file_path):
         print(f"Error: '{file_path}' not found in {os.getcwd()}")
         return None
     try:
-        with open(file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                extracted = page.extract_text()
-                if extracted:
-                    text += extracted
-            if not text:
-                print("Error: No text extracted from PDF")
-                return None
-            return text
+        manual = load_cached_text(file_path, build_section_map)
+        if manual is None:
+            print("Error: No text extracted from PDF")
+            return None
+        return manual
     except Exception as e:
         print(f"Error reading PDF: {e}")
         return None
 
-def extract_issue_info(issue, manual_content):
+def extract_issue_info(issue, manual):
     """Extract relevant manual info based on the issue."""
-    issue_keywords = {
-        "failure to fire": "Issue: Failure to Fire",
-        "failure to feed": "Issue: Failure to Feed",
-        "clean": "Cleaning:",
-    }
-    for keyword, manual_section in issue_keywords.items():
-        if keyword in issue.lower():
-            start_idx = manual_content.lower().find(manual_section.lower())
-            if start_idx != -1:
-                end_idx = manual_content.find("Issue:", start_idx + 1)
-                if end_idx == -1:
-                    end_idx = manual_content.find("CHAPTER", start_idx + 1)
-                if end_idx == -1:
-                    end_idx = len(manual_content)
-                return manual_content[start_idx:end_idx].strip()
-    start_idx = manual_content.find("2-3. TROUBLESHOOTING")
-    if start_idx != -1:
-        end_idx = manual_content.find("CHAPTER 3:", start_idx + 1)
-        if end_idx == -1:
-            end_idx = len(manual_content)
-        return manual_content[start_idx:end_idx].strip()
-    return manual_content[:2000]
+    for keyword in ISSUE_KEYWORDS:
+        if keyword in issue.lower() and keyword in manual.sections:
+            return manual.section(keyword).strip()
+    if "troubleshooting" in manual.sections:
+        return manual.section("troubleshooting").strip()
+    return manual.section("intro")
 
-def get_response(issue, manual_content):
-    """Generate a conversational response using Ollama."""
-    client = ollama.Client(host='http://127.0.0.1:11434')
-    relevant_info = extract_issue_info(issue, manual_content)
-    prompt = (
+def build_prompt(issue, manual_content):
+    """Build the Ollama prompt for the user's issue."""
+    relevant_info = fit_to_budget(extract_issue_info(issue, manual_content))
+    return (
         f"You are AiLEAN, a friendly military maintenance expert. "
         f"Respond to the user's issue conversationally, but in minimal sentences and very be straighforward. "
-        f"Use this M4 Carbine manual info: {relevant_info[:2000]}... "
+        f"Use this M4 Carbine manual info: {relevant_info} "
         f"User issue: '{issue}'. "
         f"Explain the fix step-by-step in a natural tone, without numbered lists. "
         f"Keep it breif, simple, and supportive. "
@@ -64,14 +74,38 @@ def get_response(issue, manual_content):
         f"only use a greeting after or encouraging ending for the first user input. Anything after that just give a direct response."
         f"Never tell the user to reference the manual. Your job is to replace them having to check the manual"
     )
+
+def get_response(issue, manual_content):
+    """Generate a conversational response using Ollama."""
+    prompt = build_prompt(issue, manual_content)
     try:
-        response = client.generate(model='llama3.2:latest', prompt=prompt, options={'timeout': 30})
+        response = llm_client.generate(prompt)
         return response['response']
     except Exception as e:
         return f"Error: {e}. Try again or check the manual!"
 
+def stream_response(issue, manual_content):
+    """Generate a response using Ollama, yielding tokens as they arrive."""
+    start = time.perf_counter()
+    prompt = build_prompt(issue, manual_content)
+    first_token_time = None
+    try:
+        for chunk in llm_client.generate_stream(prompt):
+            token = chunk['response']
+            if not token:
+                continue
+            if first_token_time is None:
+                first_token_time = time.perf_counter() - start
+                logger.info("time to first token %.0f ms", first_token_time * 1000)
+            yield token
+    except Exception as e:
+        yield f"Error: {e}. Try again or check the manual!"
+    logger.info("response finished in %.0f ms", (time.perf_counter() - start) * 1000)
+
 def main():
     """Run the chatbot with error handling."""
+    logging.basicConfig(filename="ailean.log", level=logging.INFO,
+                        format="%(asctime)s %(name)s %(levelname)s %(message)s")
     manual_file = "m4_manual.pdf"
     manual_content = load_manual(manual_file)
     if not manual_content:
@@ -87,8 +121,10 @@ def main():
             if not issue.strip():
                 print("Please enter an issue, like 'My M4 won’t fire'.")
                 continue
-            response = get_response(issue, manual_content)
-            print(f"\n{response}\n")
+            print()
+            for token in stream_response(issue, manual_content):
+                print(token, end="", flush=True)
+            print("\n")
         except KeyboardInterrupt:
             print("\nBye!")
             break
@@ -0,0 +1,211 @@
+import re
+
+from manual_store import read_manual, read_manual_range
+from response_cache import cache
+from section_index import index_sections
+from storage import get_connection
+
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 300
+WHITESPACE = re.compile(r"\s")
+
+# Words too common in questions to help rank manual chunks
+STOP_WORDS = {
+    "a", "an", "and", "are", "at", "be", "but", "by", "can", "do", "does", "for", "from",
+    "have", "how", "i", "if", "in", "is", "it", "its", "me", "my", "of", "on", "or", "so",
+    "that", "the", "this", "to", "was", "what", "when", "where", "which", "why", "will",
+    "with", "you", "your",
+}
+
+
+def split_chunks(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Split manual text into overlapping (offset, chunk) pairs.
+
+    Chunks end on a paragraph break or whitespace, and the overlap is
+    moved forward to the next whitespace, so where possible retrieved
+    passages neither start nor stop mid-word. Each chunk is exactly
+    text[offset:offset + len(chunk)], so it can be read back from the
+    stored manual instead of being stored again.
+    """
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(length, start + chunk_size)
+        if end < length:
+            boundary = text.rfind('\n\n', start + overlap, end)
+            if boundary == -1:
+                boundary = text.rfind(' ', start + overlap, end)
+            if boundary != -1:
+                end = boundary
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append((text.index(chunk[0], start), chunk))
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+        if not text[start - 1].isspace():
+            space = WHITESPACE.search(text, start, end)
+            if space:
+                start = space.end()
+    return chunks
+
+
+def equipment_filter(equipment_id):
+    """FTS5 column filter selecting one manual's chunks."""
+    return f'equipment_id : "{equipment_id}"'
+
+
+def unindex_chunks(cursor, equipment_id):
+    """Remove a manual's chunks from the index.
+
+    manual_chunks is contentless, so FTS5 needs each chunk's original
+    text to delete it; that is read back from the stored manual, which
+    must therefore still be the text the chunks were indexed from.
+    """
+    cursor.execute(
+        "SELECT chunk_id, start_offset, end_offset FROM manual_chunk_spans WHERE equipment_id = ?",
+        (equipment_id,)
+    )
+    spans = cursor.fetchall()
+    if not spans:
+        return
+    text = read_manual(equipment_id) or ""
+    cursor.executemany(
+        "INSERT INTO manual_chunks (manual_chunks, rowid, content, equipment_id) VALUES ('delete', ?, ?, ?)",
+        ((chunk_id, text[start:end], str(equipment_id)) for chunk_id, start, end in spans)
+    )
+    cursor.execute("DELETE FROM manual_chunk_spans WHERE equipment_id = ?", (equipment_id,))
+
+
+def index_manual(cursor, equipment_id, text):
+    """(Re)build the chunk and section indexes for one manual.
+
+    Call this before store_manual() replaces a manual's text, so the
+    old chunks can still be unindexed. Only each chunk's span is kept;
+    its text is read from the compressed manual blocks when needed.
+
+    Every (re)ingest passes through here, so cached answers for the
+    manual are dropped at the same time. So are its chunk vectors:
+    chunk ids are reused, and stale vectors would be matched to the new
+    chunks. Retrieval falls back to BM25 until it is re-embedded.
+    """
+    from semantic_index import load_versioned_vectors  # semantic_index imports this module
+
+    cache.invalidate(equipment_id, cursor)
+    index_sections(cursor, equipment_id, text)
+    cursor.execute("DELETE FROM manual_vectors WHERE equipment_id = ?", (equipment_id,))
+    load_versioned_vectors.cache_clear()
+    unindex_chunks(cursor, equipment_id)
+    cursor.execute("SELECT COALESCE(MAX(chunk_id), 0) FROM manual_chunk_spans")
+    first_id = cursor.fetchone()[0] + 1
+    chunks = [(first_id + i, offset, chunk) for i, (offset, chunk) in enumerate(split_chunks(text))]
+    cursor.executemany(
+        "INSERT INTO manual_chunks (rowid, content, equipment_id) VALUES (?, ?, ?)",
+        ((chunk_id, chunk, str(equipment_id)) for chunk_id, _, chunk in chunks)
+    )
+    cursor.executemany(
+        "INSERT INTO manual_chunk_spans (chunk_id, equipment_id, start_offset, end_offset) VALUES (?, ?, ?, ?)",
+        ((chunk_id, equipment_id, offset, offset + len(chunk)) for chunk_id, offset, chunk in chunks)
+    )
+
+
+def index_missing_manuals(cursor):
+    """Index any manuals stored before the chunk index existed."""
+    cursor.execute("""
+        SELECT equipment_id FROM manuals
+        WHERE equipment_id NOT IN (SELECT DISTINCT equipment_id FROM manual_chunk_spans)
+    """)
+    missing = [row[0] for row in cursor.fetchall()]
+    for equipment_id in missing:
+        index_manual(cursor, equipment_id, read_manual(equipment_id))
+    return len(missing)
+
+
+def query_terms(text):
+    """Return the distinct non-stop-word terms of free text, in order."""
+    terms = []
+    for term in re.findall(r"[a-z0-9]+", text.lower()):
+        if term not in STOP_WORDS and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 OR-query of quoted terms."""
+    return " OR ".join(f'"{term}"' for term in query_terms(text))
+
+
+def read_chunks(equipment_id, spans):
+    """Turn (chunk_id, start, end) spans into (offset, chunk) pairs read from the stored manual."""
+    return [(start, read_manual_range(equipment_id, start, end)) for _, start, end in spans]
+
+
+def search_chunk_ids(equipment_id, text, limit=50):
+    """Return the rowids of the best-ranked chunks for a question, by BM25, without reading their text."""
+    terms = build_match_query(text)
+    if not terms:
+        return []
+    try:
+        cursor = get_connection().cursor()
+        cursor.execute(
+            "SELECT rowid FROM manual_chunks WHERE manual_chunks MATCH ? ORDER BY rank LIMIT ?",
+            (f'{equipment_filter(equipment_id)} AND content : ({terms})', limit)
+        )
+        return [row[0] for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"Error searching manual index: {e}")
+        return []
+
+
+def search_chunks(equipment_id, text, limit=5):
+    """Return the best-ranked (offset, chunk) pairs for a question, by BM25."""
+    terms = build_match_query(text)
+    if not terms:
+        return []
+    try:
+        cursor = get_connection().cursor()
+        cursor.execute("""
+            SELECT spans.chunk_id, spans.start_offset, spans.end_offset
+            FROM (
+                SELECT rowid, rank FROM manual_chunks
+                WHERE manual_chunks MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            ) AS hits
+            JOIN manual_chunk_spans AS spans ON spans.chunk_id = hits.rowid
+            ORDER BY hits.rank
+        """, (f'{equipment_filter(equipment_id)} AND content : ({terms})', limit))
+        spans = cursor.fetchall()
+    except Exception as e:
+        print(f"Error searching manual index: {e}")
+        return []
+    return read_chunks(equipment_id, spans)
+
+
+def leading_chunks(equipment_id, limit=1):
+    """Return the first chunks of a manual, for questions with no keyword hits."""
+    try:
+        cursor = get_connection().cursor()
+        cursor.execute("""
+            SELECT chunk_id, start_offset, end_offset FROM manual_chunk_spans
+            WHERE equipment_id = ?
+            ORDER BY chunk_id
+            LIMIT ?
+        """, (equipment_id, limit))
+        spans = cursor.fetchall()
+    except Exception as e:
+        print(f"Error reading manual index: {e}")
+        return []
+    return read_chunks(equipment_id, spans)
+
+
+def has_index(equipment_id):
+    """Check whether a manual has been chunk-indexed."""
+    try:
+        cursor = get_connection().cursor()
+        cursor.execute("SELECT 1 FROM manual_chunk_spans WHERE equipment_id = ? LIMIT 1", (equipment_id,))
+        return cursor.fetchone() is not None
+    except Exception as e:
+        print(f"Error reading manual index: {e}")
+        return False
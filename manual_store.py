@@ -0,0 +1,96 @@
+import os
+import zlib
+from functools import lru_cache
+
+from storage import bump_manual_version, get_connection
+
+# Manual text is stored as zlib-compressed blocks of this many characters
+BLOCK_CHARS = 32 * 1024
+COMPRESS_LEVEL = 6
+# Decompressed blocks kept in memory (256 blocks is about 8 MB of text)
+BLOCK_CACHE_SIZE = int(os.environ.get("AILEAN_BLOCK_CACHE", "256"))
+
+
+def store_manual(cursor, equipment_id, text):
+    """Store a manual's text as compressed blocks, replacing any earlier copy."""
+    cursor.execute("DELETE FROM manual_blocks WHERE equipment_id = ?", (equipment_id,))
+    cursor.executemany(
+        "INSERT INTO manual_blocks (equipment_id, block_no, data) VALUES (?, ?, ?)",
+        (
+            (equipment_id, block_no, zlib.compress(text[start:start + BLOCK_CHARS].encode('utf-8'), COMPRESS_LEVEL))
+            for block_no, start in enumerate(range(0, len(text), BLOCK_CHARS))
+        )
+    )
+    # The blocks are now the only copy; the old TEXT column is left empty
+    cursor.execute(
+        "UPDATE manuals SET manual_content = '', content_length = ? WHERE equipment_id = ?",
+        (len(text), equipment_id)
+    )
+    bump_manual_version(cursor, equipment_id)
+    read_block.cache_clear()
+
+
+def store_missing_manuals(cursor):
+    """Move manuals stored as a single TEXT value into compressed blocks."""
+    cursor.execute("SELECT equipment_id FROM manuals WHERE content_length IS NULL")
+    missing = [row[0] for row in cursor.fetchall()]
+    for equipment_id in missing:
+        cursor.execute("SELECT manual_content FROM manuals WHERE equipment_id = ?", (equipment_id,))
+        store_manual(cursor, equipment_id, cursor.fetchone()[0])
+    return len(missing)
+
+
+@lru_cache(maxsize=BLOCK_CACHE_SIZE)
+def read_block(equipment_id, version, block_no):
+    """Fetch and decompress one block of a manual; version only keys the cache."""
+    cursor = get_connection().cursor()
+    cursor.execute(
+        "SELECT data FROM manual_blocks WHERE equipment_id = ? AND block_no = ?",
+        (equipment_id, block_no)
+    )
+    result = cursor.fetchone()
+    return zlib.decompress(result[0]).decode('utf-8') if result else ""
+
+
+def manual_length(equipment_id):
+    """Return a manual's (length in characters, version), or (None, None) if it isn't stored.
+
+    Read on every range so a manual rewritten by another process is
+    never read through stale cached blocks.
+    """
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT content_length, version FROM manuals WHERE equipment_id = ?", (equipment_id,))
+    return cursor.fetchone() or (None, None)
+
+
+def read_manual_range(equipment_id, start, end):
+    """Read characters [start, end) of a stored manual, decompressing only the blocks involved."""
+    try:
+        length, version = manual_length(equipment_id)
+        end = min(end, length or 0)
+        if start >= end:
+            return ""
+        first, last = start // BLOCK_CHARS, (end - 1) // BLOCK_CHARS
+        text = "".join(read_block(equipment_id, version, block_no) for block_no in range(first, last + 1))
+        return text[start - first * BLOCK_CHARS:end - first * BLOCK_CHARS]
+    except Exception as e:
+        print(f"Error reading manual: {e}")
+        return ""
+
+
+def read_manual(equipment_id):
+    """Read a whole manual, bypassing the block cache; None if there is no such manual."""
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT content_length FROM manuals WHERE equipment_id = ?", (equipment_id,))
+    result = cursor.fetchone()
+    if not result:
+        return None
+    if result[0] is None:
+        # Not moved into blocks yet
+        cursor.execute("SELECT manual_content FROM manuals WHERE equipment_id = ?", (equipment_id,))
+        return cursor.fetchone()[0]
+    cursor.execute(
+        "SELECT data FROM manual_blocks WHERE equipment_id = ? ORDER BY block_no",
+        (equipment_id,)
+    )
+    return "".join(zlib.decompress(data).decode('utf-8') for (data,) in cursor)
@@ -1,18 +1,39 @@
-import ollama
-import sqlite3
+import logging
+import re
+import time
+from array import array
+from bisect import bisect_left, bisect_right
 from datetime import datetime
+from functools import lru_cache
+
+import llm_client
+from context_packer import MAX_CONTEXT_CHARS, fit_to_budget, pack_context
+from conversation import Conversation
+from intent import classify, section_text
+from manual_index import has_index, leading_chunks, query_terms, search_chunks
+from manual_store import read_manual, read_manual_range
+from response_cache import cache, make_key
+from section_index import best_section, find_sections, load_sections, section_at, sections_for_text
+from semantic_index import semantic_search
+from tracing import current_trace, start_trace, timed
+
+logger = logging.getLogger(__name__)
+
+# Sections longer than this are too broad to send whole; a window around the hit is used instead
+MAX_SECTION_CHARS = 2500
+SMALL_TALK_REPLIES = {
+    "thanks": "You're welcome! Anything else I can help with on the {equipment_name}?",
+    "acknowledge": "Sounds good. Let me know if anything else comes up with the {equipment_name}.",
+}
 
 
 def load_manual(equipment_id):
     """Load manual content from the database using equipment_id."""
     try:
-        conn = sqlite3.connect("military_manuals.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT manual_content FROM manuals WHERE equipment_id = ?", (equipment_id,))
-        result = cursor.fetchone()
-        conn.close()
+        with timed("manual_load"):
+            result = read_manual(equipment_id)
         if result:
-            return result[0]
+            return result
         print(f"Error: No content found for equipment ID {equipment_id}")
         return None
     except Exception as e:
@@ -20,177 +41,528 @@ def load_manual(equipment_id):
         return None
 
 
+def open_manual(equipment_id):
+    """Get a manual ready for questions: (indexed, manual_content), or None if it has no content.
+
+    Indexed manuals are queried chunk by chunk, so manual_content is
+    None for them; only unindexed ones are loaded whole.
+    """
+    indexed = has_index(equipment_id)
+    manual_content = None if indexed else load_manual(equipment_id)
+    if not indexed and not manual_content:
+        return None
+    return indexed, manual_content
+
+
+# Comprehensive equipment-related terms for different types of manuals
+EQUIPMENT_TERMS = {
+    # Aircraft terms
+    'specifications': ['wingspan', 'length', 'height', 'weight', 'dimensions', 'specs', 'specifications'],
+    'engine': ['engine', 'propeller', 'power plant', 'turboprop', 'horsepower', 'rpm'],
+    'landing gear': ['landing', 'gear', 'touchdown', 'approach', 'wheels', 'struts'],
+    'flight operations': ['takeoff', 'departure', 'climb', 'cruise', 'descent', 'flight'],
+    'fuel system': ['fuel', 'gas', 'tank', 'consumption', 'capacity', 'gallons'],
+    'electrical': ['electrical', 'power', 'battery', 'generator', 'voltage', 'amperage'],
+    'hydraulic': ['hydraulic', 'fluid', 'pressure', 'pump'],
+    'navigation': ['navigation', 'nav', 'compass', 'gps', 'instruments'],
+    'communication': ['communication', 'radio', 'comm', 'frequency'],
+    'cargo': ['cargo', 'load', 'weight', 'payload', 'capacity'],
+    'flight controls': ['controls', 'rudder', 'elevator', 'aileron', 'flaps'],
+    'instruments': ['instruments', 'gauges', 'display', 'panel', 'cockpit'],
+    'systems': ['system', 'oxygen', 'ods', 'breathing', 'life support', 'environmental'],
+
+    # Weapon/Vehicle terms
+    'ammunition': ['ammo', 'ammunition', 'rounds', 'magazine', 'cartridge'],
+    'barrel': ['barrel', 'muzzle', 'rifling', 'bore'],
+    'trigger': ['trigger', 'firing', 'safety', 'selector'],
+    'maintenance': ['cleaning', 'lubrication', 'inspection', 'service'],
+
+    # General mechanical terms
+    'operation': ['operation', 'operating', 'function', 'how to', 'procedure'],
+    'performance': ['performance', 'capability', 'range', 'speed', 'rate']
+}
+
+PROBLEM_INDICATORS = [
+    'not working', 'broken', 'failed', 'error', 'problem', 'issue',
+    'malfunction', 'stuck', 'jammed', 'won\'t start', 'won\'t turn',
+    'leaking', 'smoking', 'overheating', 'strange noise', 'vibration',
+    'fix', 'repair', 'troubleshoot'
+]
+
+WORD = re.compile(r"[a-z0-9]+")
+
+TROUBLESHOOTING_KEYWORDS = [
+    "troubleshoot", "troubleshooting", "maintenance", "repair",
+    "failure", "malfunction", "corrective action", "fault", "defect"
+]
+
+
+@lru_cache(maxsize=8)
+def lowered_manual(manual_content):
+    """Return the lower-cased manual, computed once per loaded manual."""
+    return manual_content.lower()
+
+
+class KeywordIndex:
+    """Where each distinct word of a lower-cased manual occurs, built in one pass per load.
+
+    Keywords are looked up in the vocabulary instead of the text, and
+    each keyword's positions are kept once found, so a question costs
+    about the same however large the manual is.
+    """
+
+    def __init__(self, manual_lower):
+        self.text = manual_lower
+        self.words = {}
+        for match in WORD.finditer(manual_lower):
+            positions = self.words.get(match.group())
+            if positions is None:
+                positions = self.words[match.group()] = array('q')
+            positions.append(match.start())
+        # Every distinct word in one string, so a keyword is found inside words by str.find
+        self.word_list = list(self.words)
+        self.vocabulary = "\n".join(self.word_list)
+        self.word_starts = []
+        offset = 0
+        for word in self.word_list:
+            self.word_starts.append(offset)
+            offset += len(word) + 1
+        self.found = {}
+
+    def positions(self, keyword):
+        """Return every start position of keyword in the manual, ascending."""
+        found = self.found.get(keyword)
+        if found is None:
+            found = self.found[keyword] = self.search(keyword)
+        return found
+
+    def search(self, keyword):
+        # A hit always starts inside one word with the keyword's first word
+        head = WORD.match(keyword)
+        if not head:
+            return scan_positions(keyword, self.text)
+        head = head.group()
+        found = []
+        pos = self.vocabulary.find(head)
+        while pos != -1:
+            i = bisect_right(self.word_starts, pos) - 1
+            inner = pos - self.word_starts[i]
+            found.extend(start + inner for start in self.words[self.word_list[i]])
+            pos = self.vocabulary.find(head, pos + 1)
+        if len(head) < len(keyword):
+            # Multi-word keywords (e.g. 'how to') must match the text after their first word too
+            found = [pos for pos in found if self.text.startswith(keyword, pos)]
+        found.sort()
+        return found
+
+
+def scan_positions(keyword, manual_lower):
+    """Find every occurrence of keyword with str.find, one scan of the whole manual."""
+    found = []
+    pos = manual_lower.find(keyword)
+    while pos != -1:
+        found.append(pos)
+        pos = manual_lower.find(keyword, pos + 1)
+    return found
+
+
+# Each index holds an 8-byte position per word of its manual, so only a few are kept
+@lru_cache(maxsize=4)
+def keyword_index(manual_content):
+    """Return the manual's KeywordIndex, built once per loaded manual."""
+    return KeywordIndex(lowered_manual(manual_content))
+
+
+def find_keyword_positions(keywords, index):
+    """Find every occurrence of each keyword through a manual's KeywordIndex.
+
+    Returns a dict mapping keyword -> ascending list of start positions,
+    including overlapping hits (e.g. 'nav' inside 'navigation'), the
+    same as a str.find scan of the lower-cased manual.
+    """
+    return {keyword: index.positions(keyword) for keyword in set(keywords)}
+
+
+def has_problem(issue_lower):
+    """Check whether the user is describing a fault rather than asking a question."""
+    return any(indicator in issue_lower for indicator in PROBLEM_INDICATORS)
+
+
 def extract_issue_info(issue, manual_content):
     """Extract relevant manual info based on the user's question or issue."""
     issue_lower = issue.lower()
-
-    # Comprehensive equipment-related terms for different types of manuals
-    equipment_terms = {
-        # Aircraft terms
-        'specifications': ['wingspan', 'length', 'height', 'weight', 'dimensions', 'specs', 'specifications'],
-        'engine': ['engine', 'propeller', 'power plant', 'turboprop', 'horsepower', 'rpm'],
-        'landing gear': ['landing', 'gear', 'touchdown', 'approach', 'wheels', 'struts'],
-        'flight operations': ['takeoff', 'departure', 'climb', 'cruise', 'descent', 'flight'],
-        'fuel system': ['fuel', 'gas', 'tank', 'consumption', 'capacity', 'gallons'],
-        'electrical': ['electrical', 'power', 'battery', 'generator', 'voltage', 'amperage'],
-        'hydraulic': ['hydraulic', 'fluid', 'pressure', 'pump'],
-        'navigation': ['navigation', 'nav', 'compass', 'gps', 'instruments'],
-        'communication': ['communication', 'radio', 'comm', 'frequency'],
-        'cargo': ['cargo', 'load', 'weight', 'payload', 'capacity'],
-        'flight controls': ['controls', 'rudder', 'elevator', 'aileron', 'flaps'],
-        'instruments': ['instruments', 'gauges', 'display', 'panel', 'cockpit'],
-        'systems': ['system', 'oxygen', 'ods', 'breathing', 'life support', 'environmental'],
-
-        # Weapon/Vehicle terms
-        'ammunition': ['ammo', 'ammunition', 'rounds', 'magazine', 'cartridge'],
-        'barrel': ['barrel', 'muzzle', 'rifling', 'bore'],
-        'trigger': ['trigger', 'firing', 'safety', 'selector'],
-        'maintenance': ['cleaning', 'lubrication', 'inspection', 'service'],
-
-        # General mechanical terms
-        'operation': ['operation', 'operating', 'function', 'how to', 'procedure'],
-        'performance': ['performance', 'capability', 'range', 'speed', 'rate']
-    }
-
-    # Find relevant content based on what the user is asking about
-    found_content = []
-
-    for category, keywords in equipment_terms.items():
-        for keyword in keywords:
-            if keyword in issue_lower:
-                # Search for this keyword in the manual
-                search_positions = []
-                start_pos = 0
-
-                # Find all occurrences of this keyword
-                while True:
-                    pos = manual_content.lower().find(keyword, start_pos)
-                    if pos == -1:
-                        break
-                    search_positions.append(pos)
-                    start_pos = pos + 1
-
-                # Extract content around each occurrence
-                for pos in search_positions:
-                    # Get surrounding context
-                    start_idx = max(0, pos - 300)
-                    end_idx = min(len(manual_content), pos + 1200)
-
-                    # Try to find natural boundaries (paragraphs, sections)
-                    section_start = manual_content.rfind('\n\n', start_idx, pos)
-                    if section_start != -1:
-                        start_idx = section_start + 2
-
-                    section_end = manual_content.find('\n\n', pos, end_idx)
-                    if section_end != -1:
-                        end_idx = section_end
-
-                    extracted = manual_content[start_idx:end_idx].strip()
-                    if len(extracted) > 50 and extracted not in found_content:
-                        found_content.append(extracted)
-
-    # If we found specific content, return the most relevant pieces
-    if found_content:
-        # Combine the most relevant sections (up to 3000 characters)
-        combined_content = '\n\n'.join(found_content)
-        return combined_content[:3000]
-
-    # If the user indicates a problem, look for troubleshooting content
-    problem_indicators = [
-        'not working', 'broken', 'failed', 'error', 'problem', 'issue',
-        'malfunction', 'stuck', 'jammed', 'won\'t start', 'won\'t turn',
-        'leaking', 'smoking', 'overheating', 'strange noise', 'vibration',
-        'fix', 'repair', 'troubleshoot'
+    manual_lower = lowered_manual(manual_content)
+
+    # Keywords the user asked about, in category order (duplicates across categories kept)
+    matched_keywords = [
+        keyword
+        for keywords in EQUIPMENT_TERMS.values()
+        for keyword in keywords
+        if keyword in issue_lower
     ]
+    keyword_positions = find_keyword_positions(matched_keywords, keyword_index(manual_content))
+    sections = sections_for_text(manual_content)
+
+    # Every keyword hit, in manual order, for scoring candidate passages
+    hits = sorted((pos, keyword) for keyword in set(matched_keywords) for pos in keyword_positions[keyword])
+    hit_starts = [pos for pos, _ in hits]
+
+    # Collect each distinct passage around a keyword hit, scored by the keywords it covers
+    candidates = {}
+    for pos in hit_starts:
+        # Prefer the whole logical section the keyword sits in, if it is short enough
+        section = section_at(sections, pos)
+        if section and section.end - section.start <= MAX_SECTION_CHARS:
+            start_idx, end_idx = section.start, section.end
+        else:
+            # Otherwise get surrounding context
+            start_idx = max(0, pos - 300)
+            end_idx = min(len(manual_content), pos + 1200)
+
+            # Try to find natural boundaries (paragraphs)
+            section_start = manual_content.rfind('\n\n', start_idx, pos)
+            if section_start != -1:
+                start_idx = section_start + 2
+
+            section_end = manual_content.find('\n\n', pos, end_idx)
+            if section_end != -1:
+                end_idx = section_end
+
+        if (start_idx, end_idx) not in candidates:
+            candidates[(start_idx, end_idx)] = passage_score(hits, hit_starts, start_idx, end_idx)
+
+    # If we found specific content, pack the most relevant passages into the token budget
+    if candidates:
+        context = pack_context(
+            ((score, start, end) for (start, end), score in candidates.items()),
+            lambda start, end: manual_content[start:end]
+        )
+        if context:
+            return context
 
-    has_problem = any(indicator in issue_lower for indicator in problem_indicators)
-
-    if has_problem:
-        # Look for troubleshooting sections
-        troubleshooting_keywords = [
-            "troubleshoot", "troubleshooting", "maintenance", "repair",
-            "failure", "malfunction", "corrective action", "fault", "defect"
-        ]
-
-        for keyword in troubleshooting_keywords:
-            start_idx = manual_content.lower().find(keyword)
+    # If the user indicates a problem, look for troubleshooting content
+    if has_problem(issue_lower):
+        # Look for troubleshooting sections, by heading first
+        section = find_troubleshooting_section(sections)
+        if section:
+            return fit_to_budget(manual_content[section.start:min(section.end, section.start + MAX_CONTEXT_CHARS)])
+        for keyword in TROUBLESHOOTING_KEYWORDS:
+            start_idx = manual_lower.find(keyword)
             if start_idx != -1:
-                end_idx = manual_content.lower().find("section", start_idx + 1)
+                end_idx = manual_lower.find("section", start_idx + 1)
                 if end_idx == -1:
-                    end_idx = manual_content.lower().find("chapter", start_idx + 1)
+                    end_idx = manual_lower.find("chapter", start_idx + 1)
                 if end_idx == -1:
-                    end_idx = min(len(manual_content), start_idx + 2000)
+                    end_idx = start_idx + MAX_CONTEXT_CHARS
 
-                return manual_content[start_idx:end_idx].strip()
+                return fit_to_budget(manual_content[start_idx:end_idx])
 
     # If nothing specific found, return general information from the beginning
-    return manual_content[:2000]
-
-
-def get_response(issue, manual_content, equipment_name, conversation_history, is_first_prompt=True):
-    """Generate a conversational response using Ollama."""
-    client = ollama.Client(host='http://localhost:11434')
-    relevant_info = extract_issue_info(issue, manual_content)
-
+    return fit_to_budget(manual_content)
+
+
+def passage_score(hits, hit_starts, start, end):
+    """Score a passage by the distinct question keywords it contains, then by how many hits."""
+    covered = hits[bisect_left(hit_starts, start):bisect_left(hit_starts, end)]
+    return len({keyword for _, keyword in covered}) + min(len(covered), 10) / 10
+
+
+def find_troubleshooting_section(sections):
+    """Return the first section whose heading names a troubleshooting keyword."""
+    for keyword in TROUBLESHOOTING_KEYWORDS:
+        section = best_section(find_sections(sections, keyword))
+        if section:
+            return section
+    return None
+
+
+def hit_offset(issue, offset, chunk):
+    """Return the manual offset of the first question term in a chunk, or the chunk's midpoint."""
+    chunk_lower = chunk.lower()
+    positions = [chunk_lower.find(term) for term in query_terms(issue)]
+    positions = [pos for pos in positions if pos != -1]
+    return offset + (min(positions) if positions else len(chunk) // 2)
+
+
+def chunk_candidates(issue, equipment_id, found_chunks):
+    """Score retrieved chunks by rank, widening each to its logical section when that is short enough.
+
+    Returns ({(start, end): score}, {(start, end): text}) with the texts
+    of the chunks already in hand; section text is read when needed.
+    """
+    sections = load_sections(equipment_id)
+    candidates = {}
+    texts = {}
+    for rank, (offset, chunk) in enumerate(found_chunks):
+        score = len(found_chunks) - rank
+        section = section_at(sections, hit_offset(issue, offset, chunk)) if sections else None
+        if section and section.end - section.start <= MAX_SECTION_CHARS:
+            span = (section.start, section.end)
+        else:
+            span = (offset, offset + len(chunk))
+            texts[span] = chunk
+        candidates[span] = max(score, candidates.get(span, 0))
+    return candidates, texts
+
+
+def pack_manual_range(equipment_id, candidates, texts):
+    """Pack scored spans of an indexed manual into the context budget."""
+    return pack_context(
+        ((score, start, end) for (start, end), score in candidates.items()),
+        lambda start, end: texts.get((start, end)) or read_manual_range(equipment_id, start, end)
+    )
+
+
+def retrieve_issue_info(issue, equipment_id):
+    """Retrieve relevant manual info from the chunk index instead of the full text."""
+    # Prefer semantic (hybrid) retrieval so paraphrased questions still find their passage
+    found_chunks = semantic_search(equipment_id, issue)
+    if not found_chunks:
+        found_chunks = search_chunks(equipment_id, issue)
+    if found_chunks:
+        context = pack_manual_range(equipment_id, *chunk_candidates(issue, equipment_id, found_chunks))
+        if context:
+            return context
+
+    if has_problem(issue.lower()):
+        section = find_troubleshooting_section(load_sections(equipment_id))
+        if section:
+            end = min(section.end, section.start + MAX_CONTEXT_CHARS)
+            return fit_to_budget(read_manual_range(equipment_id, section.start, end))
+        found_chunks = search_chunks(equipment_id, ' '.join(TROUBLESHOOTING_KEYWORDS), limit=1)
+        if found_chunks:
+            return fit_to_budget(found_chunks[0][1])
+
+    found_chunks = leading_chunks(equipment_id)
+    if found_chunks:
+        return fit_to_budget(found_chunks[0][1])
+    return ""
+
+
+def time_greeting():
+    """Return the greeting for the current time of day."""
     current_hour = datetime.now().hour
     if current_hour < 12:
-        greeting = "Good morning"
+        return "Good morning"
     elif current_hour < 18:
-        greeting = "Good afternoon"
-    else:
-        greeting = "Good evening"
-
-    history_text = ""
-    if conversation_history:
-        history_text = "Previous conversation:\n"
-        for user_issue, bot_response in conversation_history[-3:]:
-            history_text += f"User: {user_issue}\nBot: {bot_response}\n"
-
-    if is_first_prompt:
-        prompt = (
-            f"You are AiLEAN, a friendly military maintenance expert. "
-            f"{greeting}. "
-            f"Respond to the user's issue conversationally, in minimal sentences, and very straightforward. "
-            f"Use this {equipment_name} manual info: {relevant_info[:2000]}... "
-            f"{history_text}"
-            f"User issue: '{issue}'. "
-            f"Explain the fix step-by-step in a natural tone, without numbered lists. "
-            f"Keep it brief, simple, and supportive. "
-            f"End with brief encouragement. "
-            f"Only use a greeting and encouraging ending for the first prompt. "
-            f"Don't introduce yourself again after the first prompt. "
-            f"Never tell the user to reference the manual. Your job is to replace them having to check the manual. "
-            f"Do not assume specific variants or models of the equipment unless specified by the user."
-        )
-    else:
-        prompt = (
-            f"Respond to the user's issue conversationally, in minimal sentences, and very straightforward. "
-            f"Use this {equipment_name} manual info: {relevant_info[:2000]}... "
-            f"{history_text}"
-            f"User issue: '{issue}'. "
-            f"Explain the fix step-by-step in a natural tone, without numbered lists. "
-            f"Keep it brief, simple, and supportive. "
-            f"Do not assume specific variants or models of the equipment unless specified by the user."
-        )
-
+        return "Good afternoon"
+    return "Good evening"
+
+
+def fast_response(issue, equipment_name, equipment_id=None, manual_content=None):
+    """Answer small talk and FAQ lookups without the model.
+
+    Returns (intent, reply); reply is None when the input needs the
+    model. FAQ replies are the manual section itself.
+    """
+    intent, section = classify(issue, equipment_id, manual_content)
+    if intent == "greeting":
+        return intent, f"{time_greeting()}! How can I assist with your {equipment_name} today?"
+    if intent in SMALL_TALK_REPLIES:
+        return intent, SMALL_TALK_REPLIES[intent].format(equipment_name=equipment_name)
+    if intent == "faq":
+        text = section_text(section, equipment_id, manual_content)
+        if text:
+            return intent, text
+    return "troubleshooting", None
+
+
+def find_relevant_info(issue, manual_content, equipment_id=None):
+    """Find manual context for a question.
+
+    When manual_content is None the context is retrieved from the chunk
+    index for equipment_id instead of scanning the full manual.
+    """
+    if manual_content is None:
+        return retrieve_issue_info(issue, equipment_id)
+    return extract_issue_info(issue, manual_content)
+
+
+def system_prompt(equipment_name):
+    """Build the instructions that open every turn's messages.
+
+    They only change with the time of day, so Ollama can reuse their
+    prefill (and that of the earlier turns after them) from turn to turn.
+    """
+    return (
+        f"You are AiLEAN, a friendly military maintenance expert for the {equipment_name}. "
+        f"{time_greeting()}. "
+        f"Respond to the user's issue conversationally, in minimal sentences, and very straightforward. "
+        f"Explain the fix step-by-step in a natural tone, without numbered lists. "
+        f"Keep it brief, simple, and supportive. "
+        f"Only use a greeting and brief encouraging ending in your first reply. "
+        f"Don't introduce yourself again after your first reply. "
+        f"Never tell the user to reference the manual. Your job is to replace them having to check the manual. "
+        f"Do not assume specific variants or models of the equipment unless specified by the user."
+    )
+
+
+def build_messages(issue, relevant_info, equipment_name, conversation):
+    """Build the Ollama chat messages for one turn.
+
+    Manual info goes in this turn's message only; earlier turns are
+    replayed (or summarized) from the conversation without it.
+    """
+    return conversation.messages(
+        system_prompt(equipment_name),
+        f"Use this {equipment_name} manual info: {relevant_info}\n\nUser issue: '{issue}'"
+    )
+
+
+def response_cache_key(issue, relevant_info, equipment_id, conversation):
+    """Return the response-cache key for a turn, or None if the answer depends on history."""
+    if conversation:
+        return None
+    # First answers open with a time-of-day greeting, so that is part of the key
+    return make_key(equipment_id, issue, relevant_info, llm_client.MODEL, time_greeting())
+
+
+def record_generation(trace, response):
+    """Copy Ollama's token count and generation time (in ns) onto a trace."""
+    if response.get('eval_count'):
+        trace.set(eval_count=response['eval_count'], eval_duration=response.get('eval_duration'))
+
+
+def prepare_answer(issue, relevant_info, equipment_name, conversation, equipment_id=None):
+    """Check the response cache and build the model's messages for one turn.
+
+    Returns (cached, messages, cache_key): the cached answer if there is
+    one, else the messages to send with generate_answer or stream_answer.
+    """
+    trace = current_trace()
+    cache_key = response_cache_key(issue, relevant_info, equipment_id, conversation)
+    if cache_key:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            trace.set(cached=True)
+            return cached, None, None
+    with trace.stage("prompt_build"):
+        messages = build_messages(issue, relevant_info, equipment_name, conversation)
+    return None, messages, cache_key
+
+
+def prepare_turn(issue, manual_content, equipment_name, conversation, equipment_id=None):
+    """Retrieve manual info for a turn, then prepare_answer.
+
+    Everything before the model call, so a server can answer cached
+    questions without waiting for a generation turn.
+    """
+    with current_trace().stage("retrieval"):
+        relevant_info = find_relevant_info(issue, manual_content, equipment_id)
+    return prepare_answer(issue, relevant_info, equipment_name, conversation, equipment_id)
+
+
+def generate_answer(messages, cache_key, equipment_id=None):
+    """Run prepared messages through the model and cache the answer; raises on model errors."""
+    trace = current_trace()
+    with trace.stage("generation"):
+        result = llm_client.chat(messages)
+    record_generation(trace, result)
+    response = result['message']['content']
+    if cache_key:
+        cache.put(cache_key, equipment_id, response)
+    return response
+
+
+def stream_answer(messages, cache_key, equipment_name, equipment_id=None, start=None):
+    """Stream prepared messages through the model, yielding tokens, and cache the answer.
+
+    start (a perf_counter time) is when the question arrived, for the
+    time-to-first-token log line; raises on model errors.
+    """
+    start = start or time.perf_counter()
+    trace = current_trace()
+    first_token_time = None
+    tokens = []
+    with trace.stage("generation"):
+        for chunk in llm_client.chat_stream(messages):
+            if chunk.get('done'):
+                record_generation(trace, chunk)
+            token = chunk['message']['content']
+            if not token:
+                continue
+            if first_token_time is None:
+                first_token_time = time.perf_counter() - start
+                trace.mark("first_token")
+                logger.info("%s: time to first token %.0f ms", equipment_name, first_token_time * 1000)
+            tokens.append(token)
+            yield token
+    if cache_key:
+        cache.put(cache_key, equipment_id, "".join(tokens))
+    logger.info("%s: response finished in %.0f ms", equipment_name, (time.perf_counter() - start) * 1000)
+
+
+def answer_with_context(issue, relevant_info, equipment_name, conversation, equipment_id=None):
+    """Answer from already-retrieved manual info, using the response cache; raises on model errors."""
+    cached, messages, cache_key = prepare_answer(issue, relevant_info, equipment_name, conversation, equipment_id)
+    if cached is not None:
+        return cached
+    return generate_answer(messages, cache_key, equipment_id)
+
+
+def get_response(issue, manual_content, equipment_name, conversation, equipment_id=None):
+    """Generate a conversational response using Ollama."""
+    trace = start_trace("response", equipment=equipment_name, turn=len(conversation))
     try:
-        response = client.generate(model='llama3.2:latest', prompt=prompt, options={'timeout': 30})
-        return response['response']
+        cached, messages, cache_key = prepare_turn(issue, manual_content, equipment_name, conversation, equipment_id)
+        if cached is not None:
+            return cached
+        return generate_answer(messages, cache_key, equipment_id)
     except Exception as e:
+        logger.error("%s: generation failed: %s", equipment_name, e)
+        trace.set(error=str(e))
         return f"Error: {e}. Try again."
+    finally:
+        trace.finish()
+
+
+def stream_response(issue, manual_content, equipment_name, conversation, equipment_id=None):
+    """Generate a conversational response using Ollama, yielding tokens as they arrive.
+
+    Time-to-first-token and total time are logged per request. Cached
+    answers are yielded whole. With tracing on, each stage is also
+    timed into the trace (see tracing.py). Any failure, in retrieval
+    (which may embed the question) as much as in generation, ends the
+    stream with an "Error: ..." token rather than an exception.
+    """
+    start = time.perf_counter()
+    trace = start_trace("stream", equipment=equipment_name, turn=len(conversation))
+    try:
+        cached, messages, cache_key = prepare_turn(issue, manual_content, equipment_name, conversation, equipment_id)
+        if cached is not None:
+            logger.info("%s: cached response in %.0f ms", equipment_name, (time.perf_counter() - start) * 1000)
+            yield cached
+            return
+        yield from stream_answer(messages, cache_key, equipment_name, equipment_id, start)
+    except Exception as e:
+        logger.error("%s: response failed: %s", equipment_name, e)
+        trace.set(error=str(e))
+        yield f"Error: {e}. Try again."
+    finally:
+        trace.finish()
+
+
+def print_stream(tokens):
+    """Print streamed tokens as they arrive and return the full response."""
+    print()
+    parts = []
+    for token in tokens:
+        print(token, end="", flush=True)
+        parts.append(token)
+    print("\n")
+    return "".join(parts)
 
 
 def run_offspring_chatbot(equipment_id, equipment_name):
     """Run the chatbot for a specific manual."""
-    manual_content = load_manual(equipment_id)
-    if not manual_content:
+    opened = open_manual(equipment_id)
+    if opened is None:
         print(f"Cannot proceed without {equipment_name} manual.")
         return
+    _, manual_content = opened
     print(
         f"\nI'm AiLEAN, your {equipment_name} Maintenance Bot! How can I help? (e.g., 'My equipment won’t work') Or, type 'exit' to return to the main menu.")
-    is_first_prompt = True
-    greetings = ["good morning", "good afternoon", "good evening", "hello", "hi"]
-    conversation_history = []
+    conversation = Conversation(equipment_name)
 
     while True:
         try:
@@ -201,22 +573,16 @@ def run_offspring_chatbot(equipment_id, equipment_name):
             if not issue:
                 print(f"Please enter an issue related to {equipment_name}.")
                 continue
-            # Check if input is exactly a greeting
-            if issue in greetings:
-                current_hour = datetime.now().hour
-                if current_hour < 12:
-                    response = f"Good morning! How can I assist with your {equipment_name} today?"
-                elif current_hour < 18:
-                    response = f"Good afternoon! How can I assist with your {equipment_name} today?"
-                else:
-                    response = f"Good evening! How can I assist with your {equipment_name} today?"
+            # Small talk and FAQ lookups are answered without the model
+            intent, response = fast_response(issue, equipment_name, equipment_id, manual_content)
+            if response:
                 print(f"\n{response}\n")
+                if intent == "faq":
+                    conversation.add(issue, response)
                 continue
             # Process as an issue
-            response = get_response(issue, manual_content, equipment_name, conversation_history, is_first_prompt)
-            print(f"\n{response}\n")
-            conversation_history.append((issue, response))
-            is_first_prompt = False
+            response = print_stream(stream_response(issue, manual_content, equipment_name, conversation, equipment_id))
+            conversation.add(issue, response)
         except KeyboardInterrupt:
             print("\nReturning to main menu...")
             break
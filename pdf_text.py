@@ -0,0 +1,72 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Below this many pages a process pool costs more than it saves
+MIN_PAGES_FOR_POOL = 16
+RANGES_PER_WORKER = 4
+
+
+def file_sha256(file_path):
+    """Hash a file's contents in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_page_range(file_path, page_numbers):
+    """Extract text for some pages of a PDF; runs in a worker process."""
+    import PyPDF2  # Imported on first use; only ingesting needs it
+
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        return [(page_no, reader.pages[page_no].extract_text() or "") for page_no in page_numbers]
+
+
+def count_pages(file_path):
+    import PyPDF2
+
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def split_ranges(page_numbers, parts):
+    """Split page numbers into at most `parts` contiguous runs."""
+    size = max(1, -(-len(page_numbers) // parts))
+    return [page_numbers[i:i + size] for i in range(0, len(page_numbers), size)]
+
+
+def extract_pages(file_path, page_numbers=None, workers=None):
+    """Yield lists of (page_no, text) as each batch of pages finishes.
+
+    Large PDFs are split across a process pool; batches arrive in
+    completion order, not page order.
+    """
+    if page_numbers is None:
+        page_numbers = list(range(count_pages(file_path)))
+    if not page_numbers:
+        return
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(page_numbers) < MIN_PAGES_FOR_POOL:
+        yield extract_page_range(file_path, page_numbers)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(extract_page_range, file_path, pages)
+                   for pages in split_ranges(page_numbers, workers * RANGES_PER_WORKER)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def join_pages(pages):
+    """Join (page_no, text) pairs in page order with a single join."""
+    return "".join(text for _, text in sorted(pages))
+
+
+def extract_text(file_path, workers=None):
+    """Extract a PDF's full text in parallel."""
+    pages = []
+    for batch in extract_pages(file_path, workers=workers):
+        pages.extend(batch)
+    return join_pages(pages)
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from storage import get_connection
+
+CACHE_SIZE = int(os.environ.get("AILEAN_CACHE_SIZE", "512"))
+CACHE_TTL = float(os.environ.get("AILEAN_CACHE_TTL", str(7 * 24 * 60 * 60)))
+# Set AILEAN_CACHE_PERSIST=0 to keep the cache in memory only
+CACHE_PERSIST = os.environ.get("AILEAN_CACHE_PERSIST", "1") != "0"
+
+
+def normalize_question(question):
+    """Lower-case a question and drop punctuation and extra whitespace."""
+    return " ".join(re.findall(r"[a-z0-9']+", question.lower()))
+
+
+def make_key(equipment_id, question, context, model, variant=""):
+    """Hash everything that determines an answer into a cache key."""
+    context_hash = hashlib.sha256(context.encode()).hexdigest()
+    parts = [str(equipment_id), normalize_question(question), context_hash, model, variant]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+class ResponseCache:
+    """LRU/TTL cache of generated answers with an optional SQLite tier."""
+
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL, persist=CACHE_PERSIST):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist = persist
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return a cached response or None, counting the hit or miss."""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and now - entry[2] < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self.entries[key]
+
+        stored = self.load(key, now) if self.persist else None
+        with self.lock:
+            if stored:
+                self.hits += 1
+                self.disk_hits += 1
+                self.remember(key, *stored)
+                return stored[1]
+            self.misses += 1
+        return None
+
+    def put(self, key, equipment_id, response):
+        """Cache a response in memory and, if enabled, on disk."""
+        now = time.time()
+        with self.lock:
+            self.remember(key, equipment_id, response, now)
+        if self.persist:
+            try:
+                conn = get_connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (cache_key, equipment_id, response, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, equipment_id, response, now)
+                )
+                conn.commit()
+            except Exception as e:
+                print(f"Error saving response cache: {e}")
+
+    def remember(self, key, equipment_id, response, created_at):
+        """Insert into the memory tier, evicting least recently used entries (lock held)."""
+        self.entries[key] = (equipment_id, response, created_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def load(self, key, now):
+        """Read an unexpired entry from the SQLite tier."""
+        try:
+            cursor = get_connection().cursor()
+            cursor.execute(
+                "SELECT equipment_id, response, created_at FROM response_cache "
+                "WHERE cache_key = ? AND created_at > ?",
+                (key, now - self.ttl)
+            )
+            return cursor.fetchone()
+        except Exception as e:
+            print(f"Error reading response cache: {e}")
+            return None
+
+    def invalidate(self, equipment_id, cursor=None):
+        """Drop every cached answer for a manual, e.g. when it is re-ingested."""
+        with self.lock:
+            for key in [k for k, entry in self.entries.items() if entry[0] == equipment_id]:
+                del self.entries[key]
+        if cursor is not None:
+            cursor.execute("DELETE FROM response_cache WHERE equipment_id = ?", (equipment_id,))
+
+    def stats(self):
+        """Return hit/miss counters for sizing the cache."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+            }
+
+
+cache = ResponseCache()
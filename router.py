@@ -0,0 +1,146 @@
+import argparse
+import logging
+import math
+import re
+import time
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from manual_index import STOP_WORDS, query_terms
+from manual_store import read_manual
+from storage import bump_manual_version, get_connection, manual_catalog
+from tracing import timed
+
+logger = logging.getLogger(__name__)
+
+# Terms kept per manual, most frequent first; past this they are too rare to tell manuals apart
+MAX_TERMS_PER_MANUAL = 20000
+# BM25 parameters, with each whole manual as one document
+K1 = 1.2
+B = 0.75
+# Added per word of the equipment's name that the question uses (e.g. "m4")
+NAME_BOOST = 5.0
+# A second manual is answered from too when it scores at least this fraction of the best
+SECOND_RATIO = 0.8
+MAX_ROUTES = 2
+
+
+def term_counts(text):
+    """Count a manual's words, leaving out stop words."""
+    counts = Counter(re.findall(r"[a-z0-9]+", text.lower()))
+    for word in STOP_WORDS:
+        counts.pop(word, None)
+    return counts
+
+
+def index_terms(cursor, equipment_id, text):
+    """Store a manual's term counts once, so routing never reads its text."""
+    counts = term_counts(text)
+    cursor.execute("DELETE FROM manual_terms WHERE equipment_id = ?", (equipment_id,))
+    cursor.executemany(
+        "INSERT INTO manual_terms (term, equipment_id, count) VALUES (?, ?, ?)",
+        ((term, equipment_id, count) for term, count in counts.most_common(MAX_TERMS_PER_MANUAL))
+    )
+    cursor.execute(
+        "UPDATE manuals SET term_count = ? WHERE equipment_id = ?",
+        (sum(counts.values()), equipment_id)
+    )
+    bump_manual_version(cursor, equipment_id)
+    stored_lengths.cache_clear()
+
+
+def index_missing_terms(cursor):
+    """Count terms for manuals stored before routing existed."""
+    cursor.execute("SELECT equipment_id FROM manuals WHERE term_count IS NULL")
+    missing = [row[0] for row in cursor.fetchall()]
+    for equipment_id in missing:
+        index_terms(cursor, equipment_id, read_manual(equipment_id) or "")
+    return len(missing)
+
+
+def manual_lengths():
+    """Return {equipment_id: term_count} for every manual with term counts.
+
+    Cached until a manual is added, removed or re-indexed, by this or
+    another process.
+    """
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT COUNT(*), TOTAL(version) FROM manuals")
+    return stored_lengths(*cursor.fetchone())
+
+
+@lru_cache(maxsize=1)
+def stored_lengths(manual_count, version_total):
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT equipment_id, term_count FROM manuals WHERE term_count IS NOT NULL")
+    return dict(cursor.fetchall())
+
+
+def score_manuals(terms):
+    """Score every manual against question terms by BM25, from the stored term counts."""
+    lengths = manual_lengths()
+    scores = defaultdict(float)
+    if not terms or not lengths:
+        return scores
+    average = sum(lengths.values()) / len(lengths) or 1
+    cursor = get_connection().cursor()
+    cursor.execute(
+        f"SELECT term, equipment_id, count FROM manual_terms WHERE term IN ({','.join('?' * len(terms))})",
+        terms
+    )
+    rows = cursor.fetchall()
+    manual_counts = Counter(term for term, _, _ in rows)
+    for term, equipment_id, count in rows:
+        idf = math.log((len(lengths) - manual_counts[term] + 0.5) / (manual_counts[term] + 0.5) + 1)
+        length = lengths.get(equipment_id, average) / average
+        scores[equipment_id] += idf * count * (K1 + 1) / (count + K1 * (1 - B + B * length))
+    return scores
+
+
+def route(question, limit=MAX_ROUTES):
+    """Pick the manual(s) most likely to cover a question, best first.
+
+    Returns up to `limit` (equipment_id, equipment_name) pairs; a
+    runner-up is only included when it scores close to the best.
+    """
+    start = time.perf_counter()
+    try:
+        with timed("routing"):
+            terms = query_terms(question)
+            scores = score_manuals(terms)
+            for equipment_name, equipment_id in manual_catalog().items():
+                named = set(terms).intersection(query_terms(equipment_name))
+                if named:
+                    scores[equipment_id] += NAME_BOOST * len(named)
+    except Exception as e:
+        print(f"Error routing question: {e}")
+        return []
+    names = {equipment_id: equipment_name for equipment_name, equipment_id in manual_catalog().items()}
+    ranked = sorted(
+        ((score, equipment_id) for equipment_id, score in scores.items() if score > 0 and equipment_id in names),
+        reverse=True
+    )
+    routes = [
+        (equipment_id, names[equipment_id]) for score, equipment_id in ranked[:limit]
+        if score >= ranked[0][0] * SECOND_RATIO
+    ]
+    logger.info("routed to %s in %.1f ms", [name for _, name in routes], (time.perf_counter() - start) * 1000)
+    return routes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show which manual(s) a question would be routed to.")
+    parser.add_argument("question")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    routes = route(args.question)
+    elapsed = (time.perf_counter() - start) * 1000
+    if not routes:
+        print("No manual matches that question.")
+    for equipment_id, equipment_name in routes:
+        print(f"{equipment_name} (equipment ID {equipment_id})")
+    print(f"Routed in {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import re
+from bisect import bisect_right
+from functools import lru_cache
+
+from manual_store import read_manual
+from storage import bump_manual_version, get_connection, manual_version
+
+# Heading levels: chapters contain sections, which contain numbered paragraphs and issue blocks
+CHAPTER, SECTION, PARAGRAPH, ISSUE = 1, 2, 3, 4
+
+HEADING_PATTERNS = [
+    (CHAPTER, re.compile(r"^[ \t]*CHAPTER[ \t]+(?:\d+|[IVXL]+)\b[^\n]*", re.MULTILINE | re.IGNORECASE)),
+    (SECTION, re.compile(r"^[ \t]*SECTION[ \t]+(?:\d+|[IVXL]+)\b[^\n]*", re.MULTILINE | re.IGNORECASE)),
+    (PARAGRAPH, re.compile(r"^[ \t]*\d+-\d+\.[ \t]+\S[^\n]*", re.MULTILINE)),
+    (ISSUE, re.compile(r"Issue:[^\n]*")),
+]
+# Headings with less body than this are usually table-of-contents entries
+MIN_BODY_CHARS = 500
+# Table-of-contents lines ("Chapter 2 ........ 4") are not headings
+DOT_LEADER = re.compile(r"(\.{4,}|…{2,})")
+
+
+class Section:
+    """One logical section of a manual: [start, end) in character offsets."""
+
+    __slots__ = ("start", "end", "level", "heading", "parent")
+
+    def __init__(self, start, end, level, heading, parent=None):
+        self.start = start
+        self.end = end
+        self.level = level
+        self.heading = heading
+        self.parent = parent
+
+    def __repr__(self):
+        return f"Section({self.start}, {self.end}, {self.level}, {self.heading!r})"
+
+
+class SectionIndex(list):
+    """Sections sorted by start, with the start offsets kept for bisection."""
+
+    def __init__(self, sections):
+        super().__init__(sections)
+        self.starts = [section.start for section in self]
+
+
+def bare_heading_title(text, end):
+    """Return the next non-blank line, for headings like 'CHAPTER 3' with the title below."""
+    for line in text[end:end + 200].split("\n")[1:]:
+        if line.strip():
+            return line.strip()
+    return ""
+
+
+def parse_sections(text):
+    """Parse chapters, sections, numbered paragraphs and Issue: blocks in one pass per pattern.
+
+    Returns a SectionIndex sorted by start offset. Each section ends
+    where the next heading of the same or a higher level begins.
+    """
+    headings = []
+    for level, pattern in HEADING_PATTERNS:
+        for match in pattern.finditer(text):
+            heading = match.group().strip()
+            if DOT_LEADER.search(heading):
+                continue
+            if level in (CHAPTER, SECTION) and len(heading.split()) <= 2:
+                heading = f"{heading} {bare_heading_title(text, match.end())}".strip()
+            start = match.start() + len(match.group()) - len(match.group().lstrip())
+            headings.append((start, level, heading))
+    headings.sort()
+
+    sections = []
+    open_indexes = []
+    for start, level, heading in headings:
+        # Close everything at this level or deeper
+        while open_indexes and sections[open_indexes[-1]].level >= level:
+            sections[open_indexes.pop()].end = start
+        parent = open_indexes[-1] if open_indexes else None
+        sections.append(Section(start, len(text), level, heading, parent))
+        open_indexes.append(len(sections) - 1)
+    return SectionIndex(sections)
+
+
+def section_at(sections, offset):
+    """Return the innermost section containing offset, in O(log n).
+
+    Bisect to the last heading before offset, then walk up its parents
+    (at most one per level) until a section spans offset.
+    """
+    index = bisect_right(sections.starts, offset) - 1
+    while index is not None and index >= 0:
+        section = sections[index]
+        if section.start <= offset < section.end:
+            return section
+        index = section.parent
+    return None
+
+
+def find_sections(sections, keyword):
+    """Return sections whose heading contains keyword (case-insensitive), in manual order."""
+    keyword = keyword.lower()
+    return [section for section in sections if keyword in section.heading.lower()]
+
+
+def index_missing_sections(cursor):
+    """Build section indexes for manuals stored before sections were indexed."""
+    cursor.execute("""
+        SELECT equipment_id FROM manuals
+        WHERE equipment_id NOT IN (SELECT DISTINCT equipment_id FROM manual_sections)
+    """)
+    missing = [row[0] for row in cursor.fetchall()]
+    for equipment_id in missing:
+        index_sections(cursor, equipment_id, read_manual(equipment_id))
+    return len(missing)
+
+
+def best_section(matches):
+    """Pick the first match with a real body, skipping table-of-contents entries."""
+    for section in matches:
+        if section.end - section.start >= MIN_BODY_CHARS:
+            return section
+    return matches[0] if matches else None
+
+
+def index_sections(cursor, equipment_id, text):
+    """Parse a manual's sections once and store them."""
+    cursor.execute("DELETE FROM manual_sections WHERE equipment_id = ?", (equipment_id,))
+    cursor.executemany(
+        "INSERT INTO manual_sections (equipment_id, section_no, start_offset, end_offset, level, heading, parent) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        ((equipment_id, i, s.start, s.end, s.level, s.heading, s.parent) for i, s in enumerate(parse_sections(text)))
+    )
+    bump_manual_version(cursor, equipment_id)
+    load_versioned_sections.cache_clear()
+
+
+def load_sections(equipment_id):
+    """Load a manual's stored section index, cached until the manual changes."""
+    try:
+        version = manual_version(equipment_id)
+    except Exception as e:
+        print(f"Error loading section index: {e}")
+        return SectionIndex([])
+    return load_versioned_sections(equipment_id, version)
+
+
+@lru_cache(maxsize=32)
+def load_versioned_sections(equipment_id, version):
+    try:
+        cursor = get_connection().cursor()
+        cursor.execute(
+            "SELECT start_offset, end_offset, level, heading, parent FROM manual_sections "
+            "WHERE equipment_id = ? ORDER BY section_no",
+            (equipment_id,)
+        )
+        rows = cursor.fetchall()
+    except Exception as e:
+        print(f"Error loading section index: {e}")
+        return SectionIndex([])
+    return SectionIndex(Section(*row) for row in rows)
+
+
+@lru_cache(maxsize=8)
+def sections_for_text(text):
+    """Parse (once) the section index of a manual held in memory."""
+    return parse_sections(text)
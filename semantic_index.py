@@ -0,0 +1,165 @@
+import os
+import re
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+import llm_client
+from manual_index import read_chunks, search_chunk_ids
+from manual_store import read_manual
+from storage import bump_manual_version, get_connection, manual_version
+
+# "hashing" selects the offline stand-in embedder; anything else is an Ollama embedding model
+EMBED_MODEL = os.environ.get("AILEAN_EMBED_MODEL", "nomic-embed-text")
+HASHING_DIM = 512
+EMBED_BATCH_SIZE = 64
+KEYWORD_WEIGHT = 0.3
+
+
+def hashing_embedder(texts, dim=HASHING_DIM):
+    """Embed texts as hashed bags of words and word pairs; deterministic and offline."""
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            matrix[row, zlib.crc32(feature.encode()) % dim] += 1.0
+    return matrix
+
+
+def ollama_embedder(texts, model=EMBED_MODEL):
+    """Embed texts with a local Ollama embedding model."""
+    return np.asarray(llm_client.embed(texts, model), dtype=np.float32)
+
+
+def embed(texts, model=EMBED_MODEL):
+    """Embed texts with the given model and L2-normalize the rows."""
+    if model == "hashing":
+        matrix = hashing_embedder(texts)
+    else:
+        matrix = ollama_embedder(texts, model)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def warm_up(model=EMBED_MODEL):
+    """Load the embedding model into Ollama so the first question's embedding is quick."""
+    if model != "hashing":
+        embed(["warm up"], model)
+
+
+def index_vectors(cursor, equipment_id, model=EMBED_MODEL):
+    """Embed every indexed chunk of a manual once and store the matrix."""
+    cursor.execute(
+        "SELECT chunk_id, start_offset, end_offset FROM manual_chunk_spans WHERE equipment_id = ? ORDER BY chunk_id",
+        (equipment_id,)
+    )
+    spans = cursor.fetchall()
+    if not spans:
+        return False
+    text = read_manual(equipment_id) or ""
+    rows = [(chunk_id, text[start:end]) for chunk_id, start, end in spans]
+    rowids = np.array([rowid for rowid, _ in rows], dtype=np.int64)
+    batches = [
+        embed([content for _, content in rows[i:i + EMBED_BATCH_SIZE]], model)
+        for i in range(0, len(rows), EMBED_BATCH_SIZE)
+    ]
+    vectors = np.vstack(batches).astype(np.float32)
+    cursor.execute(
+        "INSERT OR REPLACE INTO manual_vectors (equipment_id, model, dim, chunk_rowids, vectors) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (equipment_id, model, vectors.shape[1], rowids.tobytes(), vectors.tobytes())
+    )
+    bump_manual_version(cursor, equipment_id)
+    load_versioned_vectors.cache_clear()
+    return True
+
+
+def index_missing_vectors(cursor, model=EMBED_MODEL):
+    """Embed any indexed manuals that don't have vectors yet."""
+    cursor.execute("""
+        SELECT equipment_id FROM manuals
+        WHERE equipment_id NOT IN (SELECT equipment_id FROM manual_vectors)
+    """)
+    count = 0
+    for (equipment_id,) in cursor.fetchall():
+        try:
+            if index_vectors(cursor, equipment_id, model):
+                count += 1
+        except Exception as e:
+            print(f"Error embedding manual {equipment_id}: {e}")
+            break
+    return count
+
+
+def load_vectors(equipment_id):
+    """Load a manual's chunk rowids, vector matrix and model, or None if not embedded."""
+    try:
+        version = manual_version(equipment_id)
+    except Exception as e:
+        print(f"Error loading manual vectors: {e}")
+        return None
+    return load_versioned_vectors(equipment_id, version)
+
+
+@lru_cache(maxsize=16)
+def load_versioned_vectors(equipment_id, version):
+    try:
+        cursor = get_connection().cursor()
+        cursor.execute(
+            "SELECT model, dim, chunk_rowids, vectors FROM manual_vectors WHERE equipment_id = ?",
+            (equipment_id,)
+        )
+        result = cursor.fetchone()
+    except Exception as e:
+        print(f"Error loading manual vectors: {e}")
+        return None
+    if not result:
+        return None
+    model, dim, rowid_blob, vector_blob = result
+    rowids = np.frombuffer(rowid_blob, dtype=np.int64)
+    vectors = np.frombuffer(vector_blob, dtype=np.float32).reshape(-1, dim)
+    return rowids, vectors, model
+
+
+def keyword_scores(equipment_id, issue, rowids, limit=50):
+    """Score chunks in [0, 1] by their BM25 rank among keyword hits."""
+    scores = np.zeros(len(rowids), dtype=np.float32)
+    hits = search_chunk_ids(equipment_id, issue, limit=limit)
+    if not hits:
+        return scores
+    positions = {rowid: i for i, rowid in enumerate(rowids.tolist())}
+    for rank, rowid in enumerate(hits):
+        if rowid in positions:
+            scores[positions[rowid]] = 1.0 - rank / len(hits)
+    return scores
+
+
+def semantic_search(equipment_id, issue, k=5, keyword_weight=KEYWORD_WEIGHT):
+    """Return the top-k (offset, chunk) pairs by cosine similarity.
+
+    With keyword_weight > 0 the score blends in the chunk's keyword
+    (BM25) rank. Returns None when the manual has no vectors.
+    """
+    loaded = load_vectors(equipment_id)
+    if loaded is None:
+        return None
+    rowids, vectors, model = loaded
+    scores = vectors @ embed([issue], model)[0]
+    if keyword_weight:
+        scores = (1.0 - keyword_weight) * scores + keyword_weight * keyword_scores(equipment_id, issue, rowids)
+
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    top_rowids = [int(rowid) for rowid in rowids[top]]
+
+    cursor = get_connection().cursor()
+    placeholders = ", ".join("?" * len(top_rowids))
+    cursor.execute(
+        f"SELECT chunk_id, start_offset, end_offset FROM manual_chunk_spans WHERE chunk_id IN ({placeholders})",
+        top_rowids
+    )
+    spans = {row[0]: row for row in cursor.fetchall()}
+    return read_chunks(equipment_id, [spans[rowid] for rowid in top_rowids if rowid in spans])
@@ -0,0 +1,229 @@
+import os
+import sqlite3
+import threading
+
+# Set AILEAN_DB to keep the database somewhere other than the working directory
+DB_PATH = os.environ.get("AILEAN_DB", "military_manuals.db")
+# Seconds a connection waits on another writer's lock before failing
+BUSY_TIMEOUT = 30
+
+# Each entry upgrades the schema by one version (PRAGMA user_version); only ever append
+MIGRATIONS = [
+    # 1: manuals with chunk, section and vector indexes, ingest bookkeeping and the response cache
+    [
+        """
+        CREATE TABLE IF NOT EXISTS manuals (
+            equipment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            equipment_name TEXT NOT NULL UNIQUE,
+            manual_content TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_equipment_name ON manuals (equipment_name)",
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS manual_chunks USING fts5(
+            content,
+            equipment_id,
+            chunk_offset UNINDEXED,
+            tokenize = 'porter unicode61'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS manual_sections (
+            equipment_id INTEGER NOT NULL,
+            section_no INTEGER NOT NULL,
+            start_offset INTEGER NOT NULL,
+            end_offset INTEGER NOT NULL,
+            level INTEGER NOT NULL,
+            heading TEXT NOT NULL,
+            parent INTEGER,
+            PRIMARY KEY (equipment_id, section_no)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS manual_vectors (
+            equipment_id INTEGER PRIMARY KEY,
+            model TEXT NOT NULL,
+            dim INTEGER NOT NULL,
+            chunk_rowids BLOB NOT NULL,
+            vectors BLOB NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ingested_files (
+            file_path TEXT PRIMARY KEY,
+            file_hash TEXT NOT NULL,
+            equipment_id INTEGER NOT NULL,
+            page_count INTEGER NOT NULL,
+            ingested_at REAL NOT NULL
+        )
+        """,
+        # Pages land here as they are extracted, so an interrupted ingest can pick up where it stopped
+        """
+        CREATE TABLE IF NOT EXISTS ingest_pages (
+            file_hash TEXT NOT NULL,
+            page_no INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (file_hash, page_no)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS response_cache (
+            cache_key TEXT PRIMARY KEY,
+            equipment_id INTEGER NOT NULL,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_response_cache_equipment ON response_cache (equipment_id)",
+    ],
+    # 2: manual text in compressed blocks (filled in by manual_store.store_missing_manuals)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS manual_blocks (
+            equipment_id INTEGER NOT NULL,
+            block_no INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (equipment_id, block_no)
+        ) WITHOUT ROWID
+        """,
+        "ALTER TABLE manuals ADD COLUMN content_length INTEGER",
+    ],
+    # 3: curated FAQs, each pointing a question at a manual section by its heading (see intent.py)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS manual_faqs (
+            equipment_id INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            heading TEXT NOT NULL,
+            PRIMARY KEY (equipment_id, question)
+        )
+        """,
+    ],
+    # 4: per-manual term counts for routing a question to the right manual (see router.py)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS manual_terms (
+            term TEXT NOT NULL,
+            equipment_id INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (term, equipment_id)
+        ) WITHOUT ROWID
+        """,
+        "ALTER TABLE manuals ADD COLUMN term_count INTEGER",
+    ],
+    # 5: a contentless chunk index; chunk text is read from manual_blocks by span, so it isn't stored twice.
+    # Chunks (and the vectors keyed by them) are rebuilt by index_missing_manuals / index_missing_vectors.
+    [
+        "DROP TABLE IF EXISTS manual_chunks",
+        "DELETE FROM manual_vectors",
+        """
+        CREATE VIRTUAL TABLE manual_chunks USING fts5(
+            content,
+            equipment_id,
+            content = '',
+            tokenize = 'porter unicode61'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS manual_chunk_spans (
+            chunk_id INTEGER PRIMARY KEY,
+            equipment_id INTEGER NOT NULL,
+            start_offset INTEGER NOT NULL,
+            end_offset INTEGER NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_chunk_spans_equipment ON manual_chunk_spans (equipment_id, chunk_id)",
+    ],
+    # 6: a per-manual version, bumped on every write to a manual's text or indexes (see manual_version)
+    [
+        "ALTER TABLE manuals ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+    ],
+]
+
+_local = threading.local()
+_migrated = set()
+_migrate_lock = threading.Lock()
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def migrate(conn):
+    """Bring a database up to the latest schema version."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], version + 1):
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def get_connection():
+    """Return this thread's connection to the database, opening it on first use.
+
+    Connections are kept per thread and per database file, and run in
+    WAL mode so chat sessions keep reading while an ingest writes. The
+    schema is migrated the first time this process opens a database.
+    """
+    path = os.path.abspath(DB_PATH)
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        with _migrate_lock:
+            if path not in _migrated:
+                migrate(conn)
+                _migrated.add(path)
+        connections[path] = conn
+    return conn
+
+
+def close_connection():
+    """Close this thread's connections, e.g. before deleting a temporary database."""
+    for conn in getattr(_local, "connections", {}).values():
+        conn.close()
+    _local.connections = {}
+
+
+def manual_version(equipment_id):
+    """Return a manual's version, or None if there is no such manual.
+
+    In-memory caches of a manual's blocks, sections and vectors are keyed
+    by it, so they stay correct when another process (e.g. ingest.py)
+    rewrites the manual while the chat server keeps reading.
+    """
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT version FROM manuals WHERE equipment_id = ?", (equipment_id,))
+    result = cursor.fetchone()
+    return result[0] if result else None
+
+
+def bump_manual_version(cursor, equipment_id):
+    """Mark a manual as changed; call from every write to its text or indexes."""
+    cursor.execute("UPDATE manuals SET version = version + 1 WHERE equipment_id = ?", (equipment_id,))
+
+
+def manual_catalog():
+    """Return {equipment_name: equipment_id}, read once and kept until invalidate_catalog()."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            cursor = get_connection().cursor()
+            cursor.execute("SELECT equipment_id, equipment_name FROM manuals")
+            _catalog = {row[1]: row[0] for row in cursor.fetchall()}
+        return dict(_catalog)
+
+
+def invalidate_catalog():
+    """Forget the cached catalog; call after adding or renaming a manual."""
+    global _catalog
+    with _catalog_lock:
+        _catalog = None
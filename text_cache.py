@@ -0,0 +1,96 @@
+import json
+import mmap
+import os
+
+from pdf_text import extract_text, file_sha256
+
+CACHE_DIR = ".ailean_cache"
+# Bump when the cached text or section map format changes
+CACHE_VERSION = 2
+
+
+class MappedManual:
+    """Manual text read through a shared, read-only memory map.
+
+    Every bot process mapping the same cache file shares one copy of
+    the text in the OS page cache; only the ranges actually used are
+    decoded into Python strings.
+    """
+
+    def __init__(self, text_path, sections):
+        self.file = open(text_path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.sections = sections
+
+    def __len__(self):
+        return len(self.data)
+
+    def text(self, start=0, end=None):
+        """Decode a byte range of the manual."""
+        return self.data[start:end].decode('utf-8', errors='ignore')
+
+    def section(self, name):
+        """Return a section's text from the precomputed map, or None."""
+        span = self.sections.get(name)
+        return self.text(*span) if span else None
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+def cache_paths(pdf_path):
+    """Return the sidecar (text, metadata) paths for a PDF."""
+    directory = os.path.join(os.path.dirname(os.path.abspath(pdf_path)), CACHE_DIR)
+    base = os.path.join(directory, os.path.basename(pdf_path))
+    return base + ".txt", base + ".json"
+
+
+def byte_span(text, start, end):
+    """Convert a character range of text into a UTF-8 byte range."""
+    byte_start = len(text[:start].encode('utf-8'))
+    return byte_start, byte_start + len(text[start:end].encode('utf-8'))
+
+
+def write_atomic(path, data):
+    """Write a file so readers never see it half-written."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+def load_cached_text(pdf_path, build_sections):
+    """Return a MappedManual for a PDF, extracting it only when the cache is stale.
+
+    The sidecar cache is keyed by the PDF's size, mtime and SHA-256:
+    matching size and mtime is trusted outright; otherwise an unchanged
+    hash just refreshes the metadata. build_sections(text) returns the
+    section map as {name: (byte_start, byte_end)}. Returns None if the
+    PDF has no text.
+    """
+    text_path, meta_path = cache_paths(pdf_path)
+    stat = os.stat(pdf_path)
+    meta = None
+    if os.path.exists(meta_path) and os.path.exists(text_path):
+        with open(meta_path) as file:
+            meta = json.load(file)
+        if meta.get("version") != CACHE_VERSION:
+            meta = None
+
+    if meta and meta["size"] == stat.st_size and meta["mtime_ns"] == stat.st_mtime_ns:
+        return MappedManual(text_path, meta["sections"])
+
+    file_hash = file_sha256(pdf_path)
+    if not meta or meta["sha256"] != file_hash:
+        text = extract_text(pdf_path)
+        if not text:
+            return None
+        os.makedirs(os.path.dirname(text_path), exist_ok=True)
+        write_atomic(text_path, text.encode('utf-8'))
+        meta = {"version": CACHE_VERSION, "sha256": file_hash, "sections": build_sections(text)}
+
+    meta["size"] = stat.st_size
+    meta["mtime_ns"] = stat.st_mtime_ns
+    write_atomic(meta_path, json.dumps(meta).encode())
+    return MappedManual(text_path, meta["sections"])
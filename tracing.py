@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Set AILEAN_TRACE=1 (or call enable()) to record stage timings; when off, tracing is a no-op
+ENABLED = os.environ.get("AILEAN_TRACE", "0") == "1"
+
+# Histogram bucket upper bounds, in seconds for stages and tokens/second for generation speed
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200)
+
+trace_logger = logging.getLogger("ailean.trace")
+_local = threading.local()
+
+
+class Histogram:
+    """A Prometheus-style cumulative histogram."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def render(self, name, labels):
+        """Return the histogram's lines in Prometheus text format."""
+        with self.lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f"{name}_sum{{{labels}}} {total:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {count}")
+        return lines
+
+
+_stage_histograms = {}
+_rate_histogram = Histogram(RATE_BUCKETS)
+_histograms_lock = threading.Lock()
+
+
+def observe_stage(stage, seconds):
+    """Add one stage duration to its histogram."""
+    histogram = _stage_histograms.get(stage)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _stage_histograms.setdefault(stage, Histogram(STAGE_BUCKETS))
+    histogram.observe(seconds)
+
+
+class Trace:
+    """Stage timings for one request, logged as one JSON line when finished."""
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.stages = {}
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def mark(self, stage):
+        """Record the time from the start of the request to now, e.g. for first token."""
+        self.record(stage, time.perf_counter() - self.start)
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def finish(self):
+        """Record the total, feed the histograms and log the trace."""
+        if getattr(_local, "trace", None) is self:
+            _local.trace = None
+        self.mark("total")
+        for stage, seconds in self.stages.items():
+            observe_stage(stage, seconds)
+        eval_count, eval_duration = self.fields.get("eval_count"), self.fields.get("eval_duration")
+        if eval_count and eval_duration:
+            self.fields["tokens_per_second"] = round(eval_count / (eval_duration / 1e9), 1)
+            _rate_histogram.observe(self.fields["tokens_per_second"])
+        trace_logger.info(json.dumps({
+            "trace": self.name,
+            **self.fields,
+            **{f"{stage}_ms": round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+        }))
+
+
+class NullTrace:
+    """Stands in for Trace when tracing is off, so call sites need no checks."""
+
+    @contextmanager
+    def stage(self, stage):
+        yield
+
+    def record(self, stage, seconds):
+        pass
+
+    def mark(self, stage):
+        pass
+
+    def set(self, **fields):
+        pass
+
+    def finish(self):
+        pass
+
+
+NULL_TRACE = NullTrace()
+
+
+def new_trace(name, **fields):
+    """Begin tracing a request that runs across threads; pass it to using() on each."""
+    return Trace(name, fields) if ENABLED else NULL_TRACE
+
+
+def start_trace(name, **fields):
+    """Begin tracing a request on this thread; returns NULL_TRACE when tracing is off."""
+    trace = new_trace(name, **fields)
+    if trace is not NULL_TRACE:
+        _local.trace = trace
+    return trace
+
+
+@contextmanager
+def using(trace):
+    """Make a trace current on this thread while part of its request runs here."""
+    previous = getattr(_local, "trace", None)
+    _local.trace = trace
+    try:
+        yield
+    finally:
+        _local.trace = previous
+
+
+def current_trace():
+    """Return the trace running on this thread, for stages timed deep in the call stack."""
+    return getattr(_local, "trace", None) or NULL_TRACE
+
+
+@contextmanager
+def timed(stage):
+    """Time a stage outside any request (e.g. loading a manual) straight into its histogram."""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def render_metrics():
+    """Return every histogram in Prometheus text exposition format."""
+    lines = [
+        "# HELP ailean_stage_seconds Time spent in each stage of answering a question.",
+        "# TYPE ailean_stage_seconds histogram",
+    ]
+    with _histograms_lock:
+        stages = sorted(_stage_histograms.items())
+    for stage, histogram in stages:
+        lines.extend(histogram.render("ailean_stage_seconds", f'stage="{stage}"'))
+    lines.extend([
+        "# HELP ailean_generation_tokens_per_second Ollama generation speed (eval_count / eval_duration).",
+        "# TYPE ailean_generation_tokens_per_second histogram",
+    ])
+    lines.extend(_rate_histogram.render("ailean_generation_tokens_per_second", 'model="ollama"'))
+    return "\n".join(lines) + "\n"